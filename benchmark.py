@@ -0,0 +1,251 @@
+import skyview
+import convert
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy
+
+galactic = numpy.array([[-0.0548755604, -0.8734370902, -0.4838350155], [0.4941094279, -0.4448296300, 0.7469822445], [-0.8676661490, -0.1980763734, 0.4559837762]])
+
+levels = [(0, -2, 2), (1, 2, 5), (2, 5, 7), (3, 7, 9), (4, 9, 10.5), (5, 10.5, 12)]
+
+def synthetic(r_filename, count, distribution, seed = 0) :
+
+	generator = numpy.random.default_rng(seed)
+
+	if distribution == "uniform" :
+
+		ra = generator.uniform(0, 360, count)
+		dec = numpy.degrees(numpy.arcsin(generator.uniform(-1, 1, count)))
+
+	elif distribution == "galactic" :
+
+		l = numpy.radians(generator.uniform(0, 360, count))
+		b = numpy.radians(numpy.clip(generator.laplace(0, 8, count), -90, 90))
+
+		v = numpy.stack([numpy.cos(b) * numpy.cos(l), numpy.cos(b) * numpy.sin(l), numpy.sin(b)], axis = 1) @ galactic
+
+		ra = numpy.degrees(numpy.arctan2(v[:, 1], v[:, 0])) % 360
+		dec = numpy.degrees(numpy.arcsin(numpy.clip(v[:, 2], -1, 1)))
+
+	else :
+		raise ValueError("unknown distribution : " + distribution)
+
+	low = 10 ** (0.6 * -1.5)
+	high = 10 ** (0.6 * 12)
+	mag = numpy.log10(low + generator.uniform(0, 1, count) * (high - low)) / 0.6
+	bv = numpy.clip(generator.normal(0.6, 0.4, count), -0.4, 2)
+
+	numpy.savetxt(r_filename, numpy.stack([ra, dec, mag, bv], axis = 1), fmt = ["%.6f", "%.6f", "%.3f", "%.3f"], delimiter = ";")
+
+def measure(function, repeat = 3) :
+
+	times = []
+	for i in range(repeat) :
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+
+	return {"min" : min(times), "median" : sorted(times)[len(times) // 2], "repeat" : repeat}
+
+def build(r_filename, level) :
+
+	catalog = skyview.Catalog.create(level)
+
+	with contextlib.redirect_stdout(io.StringIO()) :
+		convert.convert(catalog, levels[: level] + [(level, levels[level][1], 36)], r_filename, ";", (0, "d"), (1, "d"), (2, "mag"), (3, "bv"))
+
+	return catalog
+
+def cameras(angles = (10, 45, 90, 170)) :
+
+	grid = []
+	for angle in angles :
+		for ra in range(0, 24, 4) :
+			for dec in (-60, -20, 20, 60) :
+				grid.append((angle, ra, dec))
+
+	return grid
+
+def run(sizes, distributions, c_levels, repeat, directory, seed = 0) :
+
+	results = {}
+
+	def record(name, function, n = repeat) :
+
+		results[name] = measure(function, n)
+		print("% 50s" % name + "% 12.4f s" % results[name]["min"], flush = True)
+
+	for distribution in distributions :
+		for size in sizes :
+
+			r_filename = os.path.join(directory, distribution + " " + str(size) + ".tsv")
+			synthetic(r_filename, size, distribution, seed)
+
+			for level in c_levels :
+
+				name = distribution + "/" + str(size) + "/" + str(level) + "/"
+				c_filename = os.path.join(directory, distribution + " " + str(size) + " " + str(level) + ".cat")
+
+				catalog = build(r_filename, level)
+				record(name + "convert", lambda : build(r_filename, level), 1)
+
+				record(name + "save", lambda : catalog.save(c_filename))
+
+				def read() :
+					with open(c_filename, "rb") as f :
+						skyview.Catalog.read(f)
+
+				record(name + "read", read)
+
+				for angle in sorted(set(camera[0] for camera in cameras())) :
+
+					grid = [camera for camera in cameras() if camera[0] == angle]
+
+					def query() :
+						for angle, ra, dec in grid :
+							location, anchor = skyview.Compute.ra_dec(ra, dec, angle)
+							skyview.View.catalog_file(c_filename, skyview.Camera(location, anchor), 10, 50, 0.1)
+
+					record(name + "catalog_file/" + str(angle), query)
+
+				location, anchor = skyview.Compute.ra_dec(6, 0, 90)
+				view = skyview.View.catalog_file(c_filename, skyview.Camera(location, anchor), 10, 50, 0)
+				s_filename = os.path.join(directory, "view.svg")
+
+				record(name + "svg", lambda : view.svg("Resource/base.svg", s_filename, 1080, 1080, 0.5, 4))
+
+				os.remove(c_filename)
+
+			os.remove(r_filename)
+
+	return results
+
+def check(directory, seed = 0) :
+
+	failures = 0
+
+	for size, level in ((60, 3), (10000, 3)) :
+
+		r_filename = os.path.join(directory, "check " + str(size) + ".tsv")
+		c_filename = os.path.join(directory, "check " + str(size) + ".cat")
+
+		synthetic(r_filename, size, "uniform", seed)
+		build(r_filename, level).save(c_filename)
+
+		array = skyview.CatalogArray.read(c_filename)
+
+		with skyview.CatalogFile(c_filename) as c_file :
+
+			for angle, ra, dec in cameras() :
+
+				location, anchor = skyview.Compute.ra_dec(ra, dec, angle)
+				expected = list(c_file.query(skyview.Camera(location, anchor), 10, 50, 0).stars)
+
+				for max_stars in (None, 1, 5, 50) :
+					for name, catalog in (("CatalogFile", c_file), ("CatalogArray", array)) :
+
+						stars = list(catalog.query(skyview.Camera(location, anchor), 10, 50, 0, max_stars).stars)
+
+						if stars != expected[: max_stars] :
+							failures += 1
+							print(name + " " + str(size) + " stars, max_stars " + str(max_stars) + ", ra " + str(ra) + " dec " + str(dec) + " angle " + str(angle) + " : mismatch")
+
+		array.close()
+
+	print(str(failures) + " mismatches")
+
+	return failures
+
+def compare(baseline, current, threshold = 0.1) :
+
+	regressions = 0
+
+	for name in sorted(set(baseline["results"]) & set(current["results"])) :
+
+		before = baseline["results"][name]["min"]
+		after = current["results"][name]["min"]
+		ratio = after / before if before > 0 else math.inf
+
+		flag = ""
+		if ratio > 1 + threshold :
+			flag = "REGRESSION"
+			regressions += 1
+		elif ratio < 1 - threshold :
+			flag = "improvement"
+
+		print("% 50s" % name + "% 12.4f s" % before + "% 12.4f s" % after + "% 8.2f x " % ratio + flag)
+
+	for name in sorted(set(baseline["results"]) ^ set(current["results"])) :
+		print("% 50s" % name + "   (only in " + ("baseline" if name in baseline["results"] else "current") + ")")
+
+	return regressions
+
+if __name__ == "__main__" :
+
+	parser = argparse.ArgumentParser(description = "Skyview benchmarks")
+	commands = parser.add_subparsers(dest = "command", required = True)
+
+	p_run = commands.add_parser("run")
+	p_run.add_argument("-o", "--output", default = "benchmark.json")
+	p_run.add_argument("--sizes", type = int, nargs = "+", default = [10000, 100000])
+	p_run.add_argument("--full", action = "store_true", help = "10k to 5M stars")
+	p_run.add_argument("--distributions", nargs = "+", default = ["uniform", "galactic"])
+	p_run.add_argument("--levels", type = int, nargs = "+", default = [2, 3])
+	p_run.add_argument("--repeat", type = int, default = 3)
+	p_run.add_argument("--seed", type = int, default = 0)
+
+	p_check = commands.add_parser("check", help = "compare query engines and max_stars against full queries")
+	p_check.add_argument("--seed", type = int, default = 0)
+
+	p_compare = commands.add_parser("compare")
+	p_compare.add_argument("baseline")
+	p_compare.add_argument("current")
+	p_compare.add_argument("--threshold", type = float, default = 0.1)
+
+	args = parser.parse_args()
+
+	if args.command == "run" :
+
+		sizes = [10000, 100000, 1000000, 5000000] if args.full else args.sizes
+
+		with tempfile.TemporaryDirectory() as directory :
+			results = run(sizes, args.distributions, args.levels, args.repeat, directory, args.seed)
+
+		meta = {
+			"date" : datetime.datetime.now().isoformat(),
+			"python" : platform.python_version(),
+			"numpy" : numpy.__version__,
+			"platform" : platform.platform(),
+			"processor" : platform.processor(),
+			"sizes" : sizes,
+			"distributions" : args.distributions,
+			"levels" : args.levels,
+			"repeat" : args.repeat,
+			"seed" : args.seed
+		}
+
+		with open(args.output, "w") as f :
+			json.dump({"meta" : meta, "results" : results}, f, indent = 1)
+
+	elif args.command == "check" :
+
+		with tempfile.TemporaryDirectory() as directory :
+			sys.exit(1 if check(directory, args.seed) else 0)
+
+	else :
+
+		with open(args.baseline) as f :
+			baseline = json.load(f)
+		with open(args.current) as f :
+			current = json.load(f)
+
+		sys.exit(1 if compare(baseline, current, args.threshold) else 0)
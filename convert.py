@@ -1,109 +1,225 @@
 import skyview
+import collections
+import io
+import multiprocessing
+import os
 import time
+import numpy
 
-def convert(catalog, levels, r_filename, separator, ra_f, dec_f, mag_f, bv_f) :
-	with open(r_filename, "r") as f :
-		lines = f.readlines()
+def fields(line, levels, separator, ra_f, dec_f, mag_f, bv_f) :
 	
-	total = len(lines)
-	done = 0
-	step = round(total ** 0.5)
-	
-	p_time = time.time()
-	
-	for line in lines :
+	line = line.split(separator)
+
+	mag = line[mag_f[0]].strip()
+	bv = line[bv_f[0]].strip()
+	ra = line[ra_f[0]].strip()
+	dec = line[dec_f[0]].strip()
+
+	if ra == "" or dec == "" or mag == "" :
+		return None
 		
-		line = line.split(separator)
-		done += 1
 		
-		if done % step >= step - 1 :
-			spent = (time.time() - p_time)
-			progress = (done * 100) / total
-			left = round((spent / progress) * (100 - progress))
-			speed = round(done / max(spent, 0.00001))
-			print(" progress :" + "% 8.1f" % progress + " %       left :" + "% 8d" % left + " s       speed :" + "% 8d" % speed + " /s", end="\r", flush=True)
+	if mag_f[1] == "mag" :
+		mag = float(mag)
 		
-		try :
+	level = -1
 
-			mag = line[mag_f[0]].strip()
-			bv = line[bv_f[0]].strip()
-			ra = line[ra_f[0]].strip()
-			dec = line[dec_f[0]].strip()
+	for l in levels :
+		if mag >= l[1] and mag < l[2] :
+			level = l[0]
+			break
+		
+	if level == -1 :
+		return None
 
-			if ra == "" or dec == "" or mag == "" :
-				continue
-				
-				
-			if mag_f[1] == "mag" :
-				mag = float(mag)
-				
-			level = -1
+	if bv == "" :
+		bv = mag
+		
+	if bv_f[1] == "bv" :
+		bv = float(bv)
+		
+	elif bv_f[1] == "b" :
+		bv = float(bv) - mag
+		
+	if ra_f[1] == "h m s" :
+		ra_hms = ra.split(" ")
+		h = int(ra_hms[0])
+		m = int(ra_hms[1])
+		s = float(ra_hms[2])
+		
+		ra = h + m / 60 + s / 3600
+	elif ra_f[1] == "d" :
+		
+		ra = float(ra) / 15
+		
+	if dec_f[1] == "d m s" :
+		dec_dms = dec.split(" ")
+		sign = dec_dms[0][0]
+		d = int(dec_dms[0][1:])
+		m = int(dec_dms[1])
+		s = float(dec_dms[2])
+		
+		if sign == "-" :
+			dec = -1 * (d + m / 60 + s / 3600)
+		else :
+			dec = d + m / 60 + s / 3600
+			
+	elif dec_f[1] == "d" :
+		
+		dec = float(dec)
 
-			for l in levels :
-				if mag >= l[1] and mag < l[2] :
-					level = l[0]
-					break
+	return level, ra, dec, mag, bv
+	
+def block(lines, levels, separator, ra_f, dec_f, mag_f, bv_f) :
+	
+	parsed = []
+	
+	for line in lines :
+		
+		try :
+			
+			row = fields(line, levels, separator, ra_f, dec_f, mag_f, bv_f)
+			
+			if row is not None :
+				parsed.append(row)
 				
-			if level == -1 :
-				continue
+		except :
+			continue
+			
+	data = numpy.array(parsed, float).reshape(-1, 5)
+	data = data[numpy.isfinite(data).all(axis = 1)]
+	
+	location = skyview.Compute.ra_decs(data[:, 1], data[:, 2])
+	brightness = skyview.Compute.mags(data[:, 3])
+	color = skyview.Compute.bvs(data[:, 4])
+	
+	return data[:, 0].astype(int), skyview.Block(location, brightness, color)
+	
+def report(done, total, rows, p_time) :
+	
+	spent = (time.time() - p_time)
+	progress = (done * 100) / total
+	left = round((spent / progress) * (100 - progress))
+	speed = round(rows / max(spent, 0.00001))
+	print(" progress :" + "% 8.1f" % progress + " %       left :" + "% 8d" % left + " s       speed :" + "% 8d" % speed + " /s", end="\r", flush=True)
 
-			if bv == "" :
-				bv = mag
-				
-			if bv_f[1] == "bv" :
-				bv = float(bv)
-				
-			elif bv_f[1] == "b" :
-				bv = float(bv) - mag
-				
-			if ra_f[1] == "h m s" :
-				ra_hms = ra.split(" ")
-				h = int(ra_hms[0])
-				m = int(ra_hms[1])
-				s = float(ra_hms[2])
-				
-				ra = h + m / 60 + s / 3600
-			elif ra_f[1] == "d" :
-				
-				ra = float(ra) / 15
+def rows(r_filename, chunk = 2 ** 20, start = 0, end = None) :
+	
+	with open(r_filename, "rb") as f :
+		
+		f.seek(start)
+		position = start
+		
+		while end is None or position < end :
+			
+			if end is None :
+				data = f.read(chunk)
+			else :
+				data = f.read(min(chunk, end - position))
 				
-			if dec_f[1] == "d m s" :
-				dec_dms = dec.split(" ")
-				sign = dec_dms[0][0]
-				d = int(dec_dms[0][1:])
-				m = int(dec_dms[1])
-				s = float(dec_dms[2])
+			if not data :
+				break
 				
-				if sign == "-" :
-					dec = -1 * (d + m / 60 + s / 3600)
-				else :
-					dec = d + m / 60 + s / 3600
-					
-			elif dec_f[1] == "d" :
+			if not data.endswith(b"\n") :
+				data += f.readline()
 				
-				dec = float(dec)
-
-			location = skyview.Compute.ra_dec(ra, dec)
-			brightness = skyview.Compute.mag(mag)
-			color = skyview.Compute.bv(bv)
+			position += len(data)
+			
+			yield position, io.TextIOWrapper(io.BytesIO(data)).readlines()
 
-			catalog.add_star(level, skyview.Star(location, brightness, color))
+def convert(catalog, levels, r_filename, separator, ra_f, dec_f, mag_f, bv_f, processes = 1, chunk = 2 ** 20) :
+	
+	if processes > 1 :
+		return convert_parallel(catalog, levels, r_filename, separator, ra_f, dec_f, mag_f, bv_f, processes, chunk)
+	
+	total = os.path.getsize(r_filename)
+	count = 0
+	
+	p_time = time.time()
+	
+	for done, lines in rows(r_filename, chunk) :
 		
-		except :
-			continue
+		catalog.add_stars(*block(lines, levels, separator, ra_f, dec_f, mag_f, bv_f))
+				
+		count += len(lines)
+		report(done, total, count, p_time)
+			
+def work(task) :
+	
+	r_filename, start, end, chunk, levels, separator, ra_f, dec_f, mag_f, bv_f = task
+	
+	blocks = []
+	count = 0
+	
+	for done, lines in rows(r_filename, chunk, start, end) :
+		
+		blocks.append(block(lines, levels, separator, ra_f, dec_f, mag_f, bv_f))
+		count += len(lines)
+		
+	s_levels = numpy.concatenate([s_levels for s_levels, s_block in blocks] + [numpy.empty(0, int)])
+	
+	return end - start, count, s_levels, skyview.Block.concatenate([s_block for s_levels, s_block in blocks])
+	
+def convert_parallel(catalog, levels, r_filename, separator, ra_f, dec_f, mag_f, bv_f, processes, chunk) :
+	
+	total = os.path.getsize(r_filename)
+	chunks = max(total // chunk, processes)
+	
+	bounds = [0]
+	with open(r_filename, "rb") as f :
+		for i_chunk in range(1, chunks) :
+			f.seek(max((total * i_chunk) // chunks, bounds[-1]))
+			f.readline()
+			bounds.append(min(f.tell(), total))
+	bounds.append(total)
+	
+	tasks = []
+	for start, end in zip(bounds[:-1], bounds[1:]) :
+		if end > start :
+			tasks.append((r_filename, start, end, chunk, levels, separator, ra_f, dec_f, mag_f, bv_f))
+	
+	done = 0
+	rows = 0
+	
+	p_time = time.time()
+	
+	def add(result) :
+		
+		nonlocal done, rows
+		
+		size, count, s_levels, s_block = result.get()
+		
+		catalog.add_stars(s_levels, s_block)
+		
+		done += size
+		rows += count
+		report(done, total, rows, p_time)
+	
+	with multiprocessing.Pool(processes) as pool :
+		
+		results = collections.deque()
+		
+		for task in tasks :
+			results.append(pool.apply_async(work, (task,)))
+			if len(results) >= 2 * processes :
+				add(results.popleft())
+				
+		while results :
+			add(results.popleft())
 			
 if __name__ == "__main__" :
 
 	bright = skyview.Catalog.create(2)
 	convert(bright, [(0, -2, 2), (1, 2, 5), (2, 5, 36)], "Raw/Bright.tsv", ";", (0, "h m s"), (1, "d m s"), (2, "mag"), (3, "bv"))
-	bright.save("Catalog/Bright.cat")
+	bright.save("Catalog/Bright.cat", sort = True)
 
 	hipparcos = skyview.Catalog.create(3)
 	convert(hipparcos, [(0, -2, 2), (1, 2, 5), (2, 5, 7), (3, 7, 36)], "Raw/Hipparcos.tsv", ";", (2, "d"), (3, "d"), (0, "mag"), (1, "bv"))
-	hipparcos.save("Catalog/Hipparcos.cat")
+	hipparcos.save("Catalog/Hipparcos.cat", sort = True)
+
+	tycho2 = skyview.Spool(5)
+	convert(tycho2, [(4, 9, 10.5), (5, 10.5, 12)], "Raw/Tycho2.tsv", ";", (0, "d"), (1, "d"), (3, "mag"), (2, "b"), os.cpu_count())
+	tycho2.save("Catalog/Tycho2.cat", sort = True)
 
-	combined_1 = skyview.Catalog.create(5)
-	convert(combined_1, [(0, -2, 2), (1, 2, 5), (2, 5, 7), (3, 7, 9)], "Raw/Hipparcos.tsv", ";", (2, "d"), (3, "d"), (0, "mag"), (1, "bv"))
-	convert(combined_1, [(4, 9, 10.5), (5, 10.5, 12)], "Raw/Tycho2.tsv", ";", (0, "d"), (1, "d"), (3, "mag"), (2, "b"))
-	combined_1.save("Catalog/Combined 1 (Hipparcos, Tycho2).cat")
+	skyview.Catalog.merge([("Catalog/Hipparcos.cat", [(0, -2, 2), (1, 2, 5), (2, 5, 7), (3, 7, 9)]), "Catalog/Tycho2.cat"], "Catalog/Combined 1 (Hipparcos, Tycho2).cat", sort = True)
 	
\ No newline at end of file
@@ -0,0 +1,24 @@
+import skyview
+import argparse
+
+def source(argument) :
+
+	if "=" not in argument :
+		return argument
+
+	filename, levels = argument.rsplit("=", 1)
+
+	return filename, [(int(depth), float(low), float(high)) for depth, low, high in (level.split(":") for level in levels.split(","))]
+
+if __name__ == "__main__" :
+
+	parser = argparse.ArgumentParser(description = "Merge or append Skyview catalogs", epilog = "A source may remap its stars to new levels by magnitude : \"Catalog/Hipparcos.cat=0:-2:2,1:2:5,2:5:7,3:7:9\".")
+	parser.add_argument("destination", help = "output catalog, may be one of the sources to append to it")
+	parser.add_argument("sources", type = source, nargs = "+")
+	parser.add_argument("--level", type = int, default = None, help = "geometry level of the output, deepest source by default")
+	parser.add_argument("--sort", action = "store_true", help = "sort each Div by descending brightness")
+	parser.add_argument("--version", type = int, default = skyview.Catalog.version)
+
+	args = parser.parse_args()
+
+	skyview.Catalog.merge(args.sources, args.destination, args.level, args.sort, args.version)
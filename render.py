@@ -1,16 +1,72 @@
 import skyview
 import pygame
+import numpy
 import math
 import datetime
+import threading
 
 pygame.init()
 
+class Worker :
+	
+	def __init__(self, tracker) :
+		
+		self.tracker = tracker
+		self.condition = threading.Condition()
+		self.request = None
+		self.view = None
+		self.running = True
+		
+		self.thread = threading.Thread(target = self.run, daemon = True)
+		self.thread.start()
+		
+	def submit(self, state) :
+		
+		with self.condition :
+			self.request = state
+			self.condition.notify()
+			
+	def result(self) :
+		
+		with self.condition :
+			return self.view
+			
+	def run(self) :
+		
+		while True :
+			
+			with self.condition :
+				while self.running and self.request is None :
+					self.condition.wait()
+				if not self.running :
+					return
+				state = self.request
+				self.request = None
+				
+			camera = skyview.Camera(skyview.Vector(*state[:3]), skyview.Vector(*state[3:]))
+			view = self.tracker.update(camera)
+			
+			with self.condition :
+				self.view = view
+				
+	def close(self) :
+		
+		with self.condition :
+			self.running = False
+			self.condition.notify()
+			
+		self.thread.join()
+
 class Render :
 	
-	def __init__(self, v_filename, s_filename, width, height, ra, dec, angle) :
+	def __init__(self, v_filename, s_filename, width, height, ra, dec, angle, budget = 64 * 2 ** 20) :
 		
 		self.v_filename = v_filename
 		self.s_filename = s_filename
+		self.v_catalog = skyview.CatalogFile(v_filename, budget)
+		self.s_catalog = skyview.CatalogFile(s_filename, budget)
+		self.worker = Worker(skyview.Tracker(self.v_catalog, 3, 60, 0.15))
+		self.sprites = {}
 		self.window = pygame.display.set_mode((width, height), pygame.RESIZABLE)
 		self.clock = pygame.time.Clock()
 		
@@ -20,7 +76,14 @@ class Render :
 		
 		self.loop()		
 
-	def render(self, r_min = 1, r_max = 8) :
+	def state(self) :
+		
+		location = self.camera.location
+		anchor = self.camera.anchor
+		
+		return (location.x, location.y, location.z, anchor.x, anchor.y, anchor.z)
+
+	def render(self, view, r_min = 1, r_max = 8) :
 		
 		self.window.fill(0)
 		
@@ -28,29 +91,41 @@ class Render :
 		height = self.window.get_height()
 		diagonal = (width ** 2 + height ** 2) ** 0.5
 		
-		view = skyview.View.catalog_file(self.v_filename, self.camera, 3, 60, 0.15)
-
-		for star in view.stars :
+		stars = view.stars
+		
+		x = (0.5 * (width + numpy.cos(stars.p) * stars.t * diagonal)).astype(int)
+		y = (0.5 * (height + numpy.sin(stars.p) * stars.t * diagonal)).astype(int)
+		r = (r_min + (r_max - r_min) * stars.weight).astype(int)
+		alpha = numpy.rint(stars.weight * 32).astype(int) * 8
+		color = numpy.minimum(numpy.rint(stars.color / 16) * 16, 255).astype(int)
+		
+		sprites = []
+		
+		for x, y, r, alpha, color in zip((x - r).tolist(), (y - r).tolist(), r.tolist(), alpha.tolist(), map(tuple, color.tolist())) :
+			sprites.append((self.sprite(r, alpha, color), (x, y)))
 			
-			x = int(0.5 * (width + math.cos(star[0]) * star[1] * diagonal))
-			y = int(0.5 * (height + math.sin(star[0]) * star[1] * diagonal))
-			r = int(r_min + (r_max - r_min) * star[2])
+		self.window.blits(sprites, False)
+		
+	def sprite(self, r, alpha, color) :
+		
+		key = (r, alpha, color)
+		
+		if not(key in self.sprites) :
 			
 			circle = pygame.Surface((r * 2, r * 2))
 			circle.set_colorkey((0, 0, 0))
-			circle.set_alpha(round(star[2] * 255))
-			pygame.draw.circle(circle, star[3], (r, r), r)
-			self.window.blit(circle, (x - r, y - r), None)
+			circle.set_alpha(min(alpha, 255))
+			pygame.draw.circle(circle, color, (r, r), r)
+			self.sprites[key] = circle
+			
+		return self.sprites[key]
 				
 	def svg(self, r_min = 0.5, r_max = 4) :
 		
 		basename = datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S")
-		view = skyview.View.catalog_file(self.s_filename, self.camera, 3, 60, 0)
+		view = skyview.View.catalog(self.s_catalog, self.camera, 3, 60, 0)
 
-		for i in range(max(len(view.stars) // 99900, 1)) :
-			s = 65536 * i
-			s_view = skyview.View(view.location, view.anchor, view.frame, view.rotation, view.stars[99900 * i : min(99900 * (i + 1), len(view.stars))])
-			s_view.svg("Resource/Base.svg", "Shot/" + basename + " " + str(i + 1) + ".svg", 1080, 1080, r_min, r_max)
+		view.svg("Resource/base.svg", "Shot/" + basename + ".svg", 1080, 1080, r_min, r_max)
 		
 		print("done")
 				
@@ -58,8 +133,10 @@ class Render :
 		
 		speeds = [1 / 100, 1/20, 1/5]
 		speed_mode = 1
-
-		self.render()
+		
+		submitted = None
+		drawn = None
+		dirty = True
 		
 		actions = []
 		
@@ -123,7 +200,7 @@ class Render :
 				elif event.type == pygame.VIDEORESIZE:
 					
 					self.window = pygame.display.set_mode((event.w, event.h), pygame.RESIZABLE)
-					self.render()
+					dirty = True
 						
 			if actions :
 							
@@ -215,13 +292,32 @@ class Render :
 					else :
 						
 						actions.remove(action)
+			
+			state = self.state()
+			
+			if state != submitted :
 				
-				self.render()		
-				self.clock.tick(10)
-
-			pygame.display.flip()
+				self.worker.submit(state)
+				submitted = state
+				
+			view = self.worker.result()
+			
+			if view is not None and (dirty or view is not drawn) :
+				
+				self.render(view)
+				pygame.display.flip()
+				
+				drawn = view
+				dirty = False
+				
+			self.clock.tick(10 if actions else 60)
+			
 		pygame.quit()
 		
+		self.worker.close()
+		self.v_catalog.close()
+		self.s_catalog.close()
+		
 if __name__ == "__main__" :
 		
 	Render("Catalog/Bright.cat", "Catalog/Hipparcos.cat", 1000, 600, 0, 0, 90)
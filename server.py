@@ -0,0 +1,267 @@
+import skyview
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import math
+import os
+import tempfile
+import time
+import urllib.parse
+
+catalog = None
+
+def init_worker(c_filename, budget) :
+
+	global catalog
+	if catalog is None :
+		catalog = skyview.CatalogFile(c_filename, budget)
+
+def render(key, step, max_level, sensitivity, min_weight, r_min, r_max) :
+
+	ra, dec, angle, rotation, size, s_format = key
+
+	start = time.perf_counter()
+
+	location, anchor = skyview.Compute.ra_dec(ra * step / 15, dec * step, angle * step)
+	camera = skyview.Camera(location, anchor)
+	if rotation :
+		camera.move(True, math.radians(rotation * step), 1)
+
+	view = skyview.View.catalog(catalog, camera, max_level, sensitivity, min_weight)
+
+	with tempfile.TemporaryDirectory() as directory :
+
+		filename = os.path.join(directory, "view." + s_format)
+
+		if s_format == "png" :
+			view.png(filename, size, size, r_min, r_max)
+		else :
+			view.svg("Resource/base.svg", filename, size, size, r_min, r_max)
+
+		with open(filename, "rb") as f :
+			data = f.read()
+
+	return data, time.perf_counter() - start
+
+class Latency :
+
+	def __init__(self, window = 1000) :
+
+		self.count = 0
+		self.total = 0
+		self.maximum = 0
+		self.recent = collections.deque(maxlen = window)
+
+	def add(self, value) :
+
+		self.count += 1
+		self.total += value
+		self.maximum = max(self.maximum, value)
+		self.recent.append(value)
+
+	def dict(self) :
+
+		recent = sorted(self.recent)
+
+		def percentile(p) :
+			return recent[min(int(len(recent) * p), len(recent) - 1)] if recent else 0
+
+		return {
+			"count" : self.count,
+			"mean" : self.total / self.count if self.count else 0,
+			"max" : self.maximum,
+			"p50" : percentile(0.5),
+			"p95" : percentile(0.95),
+			"p99" : percentile(0.99)
+		}
+
+class Server :
+
+	types = {"png" : "image/png", "svg" : "image/svg+xml"}
+
+	def __init__(self, c_filename, processes = None, budget = 0, limit = 256 * 2 ** 20, step = 0.01, max_size = 4096, max_level = 10, sensitivity = 50, min_weight = 0.1, r_min = 0.5, r_max = 4) :
+
+		global catalog
+		catalog = skyview.CatalogFile(c_filename, budget)
+
+		self.pool = concurrent.futures.ProcessPoolExecutor(processes, initializer = init_worker, initargs = (c_filename, budget))
+		self.options = (step, max_level, sensitivity, min_weight, r_min, r_max)
+		self.step = step
+		self.max_size = max_size
+
+		self.cache = collections.OrderedDict()
+		self.size = 0
+		self.limit = limit
+		self.pending = {}
+
+		self.hits = 0
+		self.misses = 0
+		self.coalesced = 0
+		self.errors = 0
+		self.latency = Latency()
+		self.render_time = Latency()
+
+	def key(self, parameters) :
+
+		def number(name, default) :
+			value = float(parameters.get(name, [default])[0])
+			if not math.isfinite(value) :
+				raise ValueError("invalid view parameters")
+			return value
+
+		ra = number("ra", 0)
+		dec = number("dec", 0)
+		angle = number("angle", 90)
+		rotation = number("rotation", 0)
+		size = int(number("size", 512))
+		s_format = parameters.get("format", ["png"])[0]
+
+		if not (-90 <= dec <= 90 and 0 < angle < 360 and 0 < size <= self.max_size and s_format in Server.types) :
+			raise ValueError("invalid view parameters")
+
+		step = self.step
+
+		try :
+			return (round(ra * 15 / step) % round(360 / step), round(dec / step), round(angle / step), round(rotation / step) % round(360 / step), size, s_format)
+		except OverflowError :
+			raise ValueError("invalid view parameters")
+
+	def store(self, key, future) :
+
+		del self.pending[key]
+
+		if future.cancelled() or future.exception() is not None :
+			return
+
+		data, seconds = future.result()
+		self.render_time.add(seconds)
+
+		self.cache[key] = data
+		self.size += len(data)
+
+		while self.size > self.limit and self.cache :
+			self.size -= len(self.cache.popitem(last = False)[1])
+
+	async def view(self, key) :
+
+		if key in self.cache :
+			self.hits += 1
+			self.cache.move_to_end(key)
+			return self.cache[key]
+
+		future = self.pending.get(key)
+
+		if future is None :
+			self.misses += 1
+			future = asyncio.get_running_loop().run_in_executor(self.pool, render, key, *self.options)
+			self.pending[key] = future
+			future.add_done_callback(lambda future : self.store(key, future))
+		else :
+			self.coalesced += 1
+
+		data, seconds = await asyncio.shield(future)
+
+		return data
+
+	def stats(self) :
+
+		return {
+			"hits" : self.hits,
+			"misses" : self.misses,
+			"coalesced" : self.coalesced,
+			"errors" : self.errors,
+			"entries" : len(self.cache),
+			"bytes" : self.size,
+			"limit" : self.limit,
+			"pending" : len(self.pending),
+			"latency" : self.latency.dict(),
+			"render" : self.render_time.dict()
+		}
+
+	async def handle(self, reader, writer) :
+
+		start = time.perf_counter()
+		status = "200 OK"
+		content_type = "application/json"
+
+		try :
+
+			method, target, version = (await reader.readline()).decode("latin-1").split()
+
+			while (await reader.readline()) not in (b"\r\n", b"\n", b"") :
+				pass
+
+			url = urllib.parse.urlsplit(target)
+
+			if method != "GET" :
+				status, body = "405 Method Not Allowed", b""
+			elif url.path == "/stats" :
+				body = json.dumps(self.stats()).encode()
+			elif url.path == "/view" :
+				key = self.key(urllib.parse.parse_qs(url.query))
+				body = await self.view(key)
+				content_type = Server.types[key[5]]
+				self.latency.add(time.perf_counter() - start)
+			else :
+				status, body = "404 Not Found", b""
+
+		except ValueError as error :
+
+			status, body = "400 Bad Request", str(error).encode()
+
+		except Exception as error :
+
+			self.errors += 1
+			status, body = "500 Internal Server Error", str(error).encode()
+
+		try :
+
+			writer.write(("HTTP/1.1 " + status + "\r\nContent-Type: " + content_type + "\r\nContent-Length: " + str(len(body)) + "\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+			await writer.drain()
+
+		except ConnectionError :
+			pass
+
+		finally :
+			writer.close()
+
+	async def serve(self, host, port) :
+
+		server = await asyncio.start_server(self.handle, host, port)
+
+		print("serving on http://" + host + ":" + str(port))
+
+		async with server :
+			await server.serve_forever()
+
+	def close(self) :
+
+		global catalog
+
+		self.pool.shutdown()
+		catalog.close()
+		catalog = None
+
+if __name__ == "__main__" :
+
+	parser = argparse.ArgumentParser(description = "Skyview view server")
+	parser.add_argument("catalog")
+	parser.add_argument("--host", default = "127.0.0.1")
+	parser.add_argument("--port", type = int, default = 8000)
+	parser.add_argument("--processes", type = int, default = os.cpu_count())
+	parser.add_argument("--budget", type = int, default = 64 * 2 ** 20)
+	parser.add_argument("--cache", type = int, default = 256 * 2 ** 20)
+	parser.add_argument("--step", type = float, default = 0.01)
+
+	args = parser.parse_args()
+
+	server = Server(args.catalog, args.processes, args.budget, args.cache, args.step)
+
+	try :
+		asyncio.run(server.serve(args.host, args.port))
+	except KeyboardInterrupt :
+		pass
+	finally :
+		server.close()
@@ -1,4 +1,13 @@
+import io
 import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+import numpy
 
 def from_binary(f, length, signed = False, ratio = False) :
 	value = int.from_bytes(f.read(length), byteorder = "big", signed = signed)
@@ -17,6 +26,21 @@ def to_binary(f, value, length, signed = False, ratio = False) :
 			value *= 2 ** (8 * length) - 1
 	f.write(round(value).to_bytes(length, byteorder = "big", signed = signed))
 	
+def to_png(f, image) :
+	
+	def chunk(kind, data) :
+		f.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+	
+	h, w = image.shape[:2]
+	
+	rows = numpy.zeros((h, w * 3 + 1), numpy.uint8)
+	rows[:, 1 :] = image.reshape(h, w * 3)
+	
+	f.write(b"\x89PNG\r\n\x1a\n")
+	chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0))
+	chunk(b"IDAT", zlib.compress(rows.tobytes(), 1))
+	chunk(b"IEND", b"")
+	
 class Vector :
 	
 	def __init__(self, x, y, z) :
@@ -113,6 +137,12 @@ class Star :
 		self.brightness.write(f)
 		self.color.write(f)
 		
+	def pack(self) :
+		
+		location = self.location
+		
+		return struct.pack(">iiiB", round(location.x * (2 ** 31 - 1)), round(location.y * (2 ** 31 - 1)), round(location.z * (2 ** 31 - 1)), round(self.brightness.brightness * (2 ** 8 - 1))) + bytes((self.color.r, self.color.g, self.color.b))
+		
 	@staticmethod
 	def read(f) :
 		
@@ -121,6 +151,83 @@ class Star :
 		color = Color.read(f)
 		
 		return Star(location, brightness, color)
+		
+class Block :
+	
+	dtype = numpy.dtype([("location", ">i4", (3,)), ("brightness", "u1"), ("color", "u1", (3,))])
+	
+	def __init__(self, location, brightness, color) :
+		self.location = location
+		self.brightness = brightness
+		self.color = color
+		
+	def __len__(self) :
+		return len(self.brightness)
+		
+	def nbytes(self) :
+		return self.location.nbytes + self.brightness.nbytes + self.color.nbytes
+		
+	def pack(self) :
+		
+		data = numpy.empty(len(self), Block.dtype)
+		
+		data["location"] = numpy.rint(self.location * (2 ** 31 - 1))
+		data["brightness"] = numpy.rint(self.brightness * (2 ** 8 - 1))
+		data["color"] = self.color
+		
+		return data.tobytes()
+		
+	@staticmethod
+	def from_stars(stars) :
+		
+		location = numpy.array([(star.location.x, star.location.y, star.location.z) for star in stars], float).reshape(-1, 3)
+		brightness = numpy.array([star.brightness.brightness for star in stars], float)
+		color = numpy.array([(star.color.r, star.color.g, star.color.b) for star in stars], numpy.uint8).reshape(-1, 3)
+		
+		return Block(location, brightness, color)
+		
+	@staticmethod
+	def concatenate(blocks) :
+		
+		if not blocks :
+			return Block(numpy.empty((0, 3)), numpy.empty(0), numpy.empty((0, 3), numpy.uint8))
+		
+		location = numpy.concatenate([block.location for block in blocks])
+		brightness = numpy.concatenate([block.brightness for block in blocks])
+		color = numpy.concatenate([block.color for block in blocks])
+		
+		return Block(location, brightness, color)
+		
+	def stars(self) :
+		
+		stars = []
+		for (x, y, z), brightness, (r, g, b) in zip(self.location.tolist(), self.brightness.tolist(), self.color.tolist()) :
+			stars.append(Star(Vector(x, y, z), Brightness(brightness), Color(r, g, b)))
+			
+		return stars
+		
+	@staticmethod
+	def parse(buffer) :
+		
+		data = numpy.frombuffer(buffer, Block.dtype)
+		
+		location = data["location"] / (2 ** 31 - 1)
+		brightness = data["brightness"] / (2 ** 8 - 1)
+		color = data["color"].copy()
+		
+		return Block(location, brightness, color)
+		
+	@staticmethod
+	def read(f, count) :
+		
+		return Block.parse(f.read(count * Block.dtype.itemsize))
+		
+	@staticmethod
+	def sort(buffer) :
+		
+		data = numpy.frombuffer(buffer, Block.dtype)
+		
+		return data[numpy.argsort(-data["brightness"].astype(int), kind = "stable")].tobytes()
 
 class Div :
 	
@@ -130,25 +237,34 @@ class Div :
 		self.stars = stars
 		self.divs = divs
 		
-	def write(self, f) :
+	def header(self, size, count) :
 		
-		self.center.write(f)
-		self.radius.write(f)
+		center = struct.pack(">iii", round(self.center.x * (2 ** 31 - 1)), round(self.center.y * (2 ** 31 - 1)), round(self.center.z * (2 ** 31 - 1)))
+		radius = round(self.radius.angle / math.pi * (2 ** 24 - 1)).to_bytes(3, byteorder = "big")
 		
-		def content(div) :
-			size = 5 + len(div.stars) * 16
-			for sub_div in div.divs :
-				size += content(sub_div) + 19
-			return size
+		return center + radius + struct.pack(">II", size, count)
+		
+	def pack(self, buffer = None) :
+		
+		if buffer is None :
+			buffer = bytearray()
 		
-		to_binary(f, content(self), 4, False, False)
+		start = len(buffer)
+		buffer += self.header(0, len(self.stars))
 		
-		to_binary(f, len(self.stars), 4, False, False)
-		for star in self.stars :
-			star.write(f)
-		to_binary(f, len(self.divs), 1, False, False)
+		if self.stars :
+			buffer += Block.from_stars(self.stars).pack()
+		buffer.append(len(self.divs))
 		for div in self.divs :
-			div.write(f)
+			div.pack(buffer)
+			
+		struct.pack_into(">I", buffer, start + 15, len(buffer) - start - 19)
+		
+		return buffer
+		
+	def write(self, f) :
+		
+		f.write(self.pack())
 		
 	@staticmethod
 	def read(f) :
@@ -158,9 +274,7 @@ class Div :
 		
 		f.read(4)
 		
-		stars = []
-		for i_star in range(from_binary(f, 4, False, False)) :
-			stars.append(Star.read(f))
+		stars = Block.read(f, from_binary(f, 4, False, False)).stars()
 		divs = []
 		for i_div in range(from_binary(f, 1, False, False)) :
 			divs.append(Div.read(f))
@@ -170,69 +284,177 @@ class Div :
 		
 class Catalog :
 	
+	magic = b"SKYV"
+	version = 3
+	index_dtypes = {
+		2 : numpy.dtype([("parent", ">i4"), ("depth", "u1"), ("path", ">u8"), ("offset", ">u8"), ("count", ">u4"), ("center", ">i4", (3,)), ("radius", ">u4")]),
+		3 : numpy.dtype([("parent", ">i4"), ("depth", "u1"), ("path", ">u8"), ("offset", ">u8"), ("count", ">u4"), ("center", ">i4", (3,)), ("radius", ">u4"), ("brightness", "u1")])
+	}
+	index_dtype = index_dtypes[version]
+	flag_sorted = 1
+	
 	def __init__(self, level, div) :
 		self.level = level
 		self.div = div
+		self.tables = None
 		
 	@staticmethod
-	def create(level) :
+	def icosahedron() :
 		
-		divs = []
+		c = []
+			
+		rings = (
+			(0, 1, 0),
+			(math.pi / 2 - math.atan(1 / 2), 5, 0),
+			(math.pi / 2 + math.atan(1 / 2), 5, math.pi / 5),
+			(math.pi, 1, 0)
+		) #(theta, number of vertex, phi offset)
+		
+		for ring in rings  :
+			
+			t = ring[0]
+			
+			c.append([])
+						
+			for i in range(ring[1]) :
+				
+				p = (i / ring[1]) * 2 * math.pi + ring[2]
+				
+				x = math.sin(t) * math.cos(p)
+				y = math.sin(t) * math.sin(p)
+				z = math.cos(t)
+				
+				c[-1].append(Vector(x, y, z))
+				
+		faces = (
 		
-		if level > 0 :
+			(c[0][0], c[1][0], c[1][1]),
+			(c[0][0], c[1][1], c[1][2]),
+			(c[0][0], c[1][2], c[1][3]),
+			(c[0][0], c[1][3], c[1][4]),
+			(c[0][0], c[1][4], c[1][0]),
+			
+			(c[1][0], c[1][1], c[2][0]),
+			(c[1][1], c[1][2], c[2][1]),
+			(c[1][2], c[1][3], c[2][2]),
+			(c[1][3], c[1][4], c[2][3]),
+			(c[1][4], c[1][0], c[2][4]),
+			
+			(c[2][0], c[2][1], c[1][1]),
+			(c[2][1], c[2][2], c[1][2]),
+			(c[2][2], c[2][3], c[1][3]),
+			(c[2][3], c[2][4], c[1][4]),
+			(c[2][4], c[2][0], c[1][0]),
+			
+			(c[3][0], c[2][0], c[2][1]),
+			(c[3][0], c[2][1], c[2][2]),
+			(c[3][0], c[2][2], c[2][3]),
+			(c[3][0], c[2][3], c[2][4]),
+			(c[3][0], c[2][4], c[2][0])
 		
-			c = []
-				
-			rings = (
-				(0, 1, 0),
-				(math.pi / 2 - math.atan(1 / 2), 5, 0),
-				(math.pi / 2 + math.atan(1 / 2), 5, math.pi / 5),
-				(math.pi, 1, 0)
-			) #(theta, number of vertex, phi offset)
+		)
+		
+		return faces
+		
+	@staticmethod
+	def geometry(level, cache = None) :
+		
+		if cache is not None :
+			
+			filename = os.path.join(cache, "icosphere " + str(level) + ".npz")
+			
+			if os.path.exists(filename) :
+				try :
+					with numpy.load(filename) as data :
+						return [(data["centers " + str(l)], data["radii " + str(l)]) for l in range(1, level + 1)]
+				except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile) :
+					pass
+		
+		def normalize(v) :
+			length = 1 / (v[:, 0] ** 2 + v[:, 1] ** 2 + v[:, 2] ** 2) ** 0.5
+			return v * length[:, None]
 			
-			for ring in rings  :
+		def distance(v, center) :
+			return numpy.arccos(numpy.clip(v[:, 0] * center[:, 0] + v[:, 1] * center[:, 1] + v[:, 2] * center[:, 2], -1, 1))
+		
+		faces = Catalog.icosahedron()
+		
+		a = numpy.array([(face[0].x, face[0].y, face[0].z) for face in faces])
+		b = numpy.array([(face[1].x, face[1].y, face[1].z) for face in faces])
+		c = numpy.array([(face[2].x, face[2].y, face[2].z) for face in faces])
+		
+		ab = (a + b) / 2
+		bc = (b + c) / 2
+		ca = (c + a) / 2
+		
+		geometry = []
+		
+		for l in range(1, level + 1) :
+			
+			a, b, c, ab, bc, ca = normalize(a), normalize(b), normalize(c), normalize(ab), normalize(bc), normalize(ca)
+			
+			center = normalize((a + b + c) / 3)
+			radius = numpy.maximum(numpy.maximum(distance(a, center), distance(b, center)), distance(c, center))
+			
+			geometry.append((center, radius))
+			
+			if l < level :
 				
-				t = ring[0]
+				aab = (a + ab) / 2
+				abb = (b + ab) / 2
+				bbc = (b + bc) / 2
+				bcc = (c + bc) / 2
+				cca = (c + ca) / 2
+				caa = (a + ca) / 2
 				
-				c.append([])
-							
-				for i in range(ring[1]) :
-					
-					p = (i / ring[1]) * 2 * math.pi + ring[2]
-					
-					x = math.sin(t) * math.cos(p)
-					y = math.sin(t) * math.sin(p)
-					z = math.cos(t)
-					
-					c[-1].append(Vector(x, y, z))
-					
-			faces = (
-			
-				(c[0][0], c[1][0], c[1][1]),
-				(c[0][0], c[1][1], c[1][2]),
-				(c[0][0], c[1][2], c[1][3]),
-				(c[0][0], c[1][3], c[1][4]),
-				(c[0][0], c[1][4], c[1][0]),
-				
-				(c[1][0], c[1][1], c[2][0]),
-				(c[1][1], c[1][2], c[2][1]),
-				(c[1][2], c[1][3], c[2][2]),
-				(c[1][3], c[1][4], c[2][3]),
-				(c[1][4], c[1][0], c[2][4]),
-				
-				(c[2][0], c[2][1], c[1][1]),
-				(c[2][1], c[2][2], c[1][2]),
-				(c[2][2], c[2][3], c[1][3]),
-				(c[2][3], c[2][4], c[1][4]),
-				(c[2][4], c[2][0], c[1][0]),
-				
-				(c[3][0], c[2][0], c[2][1]),
-				(c[3][0], c[2][1], c[2][2]),
-				(c[3][0], c[2][2], c[2][3]),
-				(c[3][0], c[2][3], c[2][4]),
-				(c[3][0], c[2][4], c[2][0])
-			
-			)
+				abc = (a + ab + bc + ca) / 4
+				bca = (b + ab + bc + ca) / 4
+				cab = (c + ab + bc + ca) / 4
+				
+				divs = (
+					( a, ab, ca, aab, abc, caa),
+					(ab,  b, bc, abb, bbc, bca),
+					(ca, bc,  c, cab, bcc, cca),
+					(bc, ca, ab, cab, abc, bca)
+				)
+				
+				a, b, c, ab, bc, ca = [numpy.stack([div[i] for div in divs], axis = 1).reshape(-1, 3) for i in range(6)]
+				
+		if cache is not None :
+			os.makedirs(cache, exist_ok = True)
+			temporary = filename + " " + str(os.getpid()) + ".part"
+			with open(temporary, "wb") as f :
+				numpy.savez(f, **{name + " " + str(l + 1) : value for l in range(level) for name, value in zip(("centers", "radii"), geometry[l])})
+			os.replace(temporary, filename)
+				
+		return geometry
+		
+	@staticmethod
+	def build(level, geometry) :
+		
+		divs = []
+		
+		for centers, radii in reversed(geometry) :
+			
+			sub_divs = divs
+			divs = []
+			
+			for i, ((x, y, z), radius) in enumerate(zip(centers.tolist(), radii.tolist())) :
+				divs.append(Div(Vector(x, y, z), Angle(radius), [], sub_divs[4 * i : 4 * i + 4]))
+				
+		return Catalog(level, Div(Vector(0, 0, 1), Angle(math.pi), [], divs))
+		
+	@staticmethod
+	def create(level, cache = None) :
+		
+		if cache is not None :
+			return Catalog.build(level, Catalog.geometry(level, cache))
+		
+		divs = []
+		
+		if level > 0 :
+			
+			faces = Catalog.icosahedron()
 			
 			def sface(l, level, a, b, c, ab, bc, ca) :
 				a.normalize()
@@ -272,68 +494,920 @@ class Catalog :
 				center = Vector((a.x + b.x + c.x) / 3, (a.y + b.y + c.y) / 3, (a.z + b.z + c.z) / 3)
 				center.normalize()
 				
-				radius = Angle(max(
-					math.acos(a.x * center.x + a.y * center.y + a.z * center.z),
-					math.acos(b.x * center.x + b.y * center.y + b.z * center.z),
-					math.acos(c.x * center.x + c.y * center.y + c.z * center.z)
-				))
+				radius = Angle(max(
+					math.acos(a.x * center.x + a.y * center.y + a.z * center.z),
+					math.acos(b.x * center.x + b.y * center.y + b.z * center.z),
+					math.acos(c.x * center.x + c.y * center.y + c.z * center.z)
+				))
+			
+				return Div(center, radius, [], divs)
+			
+			for face in faces :
+				a = face[0]
+				b = face[1]
+				c = face[2]
+				
+				ab = Vector((a.x + b.x) / 2, (a.y + b.y) / 2, (a.z + b.z) / 2)
+				bc = Vector((b.x + c.x) / 2, (b.y + c.y) / 2, (b.z + c.z) / 2)
+				ca = Vector((c.x + a.x) / 2, (c.y + a.y) / 2, (c.z + a.z) / 2)
+			
+				divs.append(sface(1, level, a, b, c, ab, bc, ca))
+		
+		return Catalog(level, Div(Vector(0, 0, 1), Angle(math.pi), [], divs))
+			
+	def locate(self, level, location) :
+		
+		path = []
+		divs = self.div.divs
+		
+		for l in range(level) :
+			
+			if not divs :
+				break
+			
+			best_distance = 4
+			
+			for i_div, div in enumerate(divs) :
+		
+				distance = (div.center.x - location.x) ** 2 + (div.center.y - location.y) ** 2 + (div.center.z - location.z) ** 2
+				if distance < best_distance :
+					best_distance = distance
+					best = i_div
+					
+			path.append(best)
+			divs = divs[best].divs
+			
+		return path
+		
+	def find(self, path) :
+		
+		div = self.div
+		for i in path :
+			div = div.divs[i]
+			
+		return div
+			
+	def add_star(self, level, star) :
+		
+		self.find(self.locate(level, star.location)).stars.append(star)
+		
+	def extend(self, path, stars) :
+		
+		self.find(path).stars.extend(stars)
+		
+	def table(self) :
+		
+		if self.tables is None :
+			
+			self.tables = []
+			
+			divs = [self.div]
+			paths = [()]
+			
+			while divs :
+				
+				children = numpy.full((len(divs), max(max(len(div.divs) for div in divs), 1)), -1, numpy.intp)
+				sub_divs = []
+				sub_paths = []
+				
+				for i, (div, path) in enumerate(zip(divs, paths)) :
+					for j, sub_div in enumerate(div.divs) :
+						children[i, j] = len(sub_divs)
+						sub_divs.append(sub_div)
+						sub_paths.append(path + (j,))
+				
+				centers = numpy.array([(div.center.x, div.center.y, div.center.z) for div in divs] + [(math.inf, math.inf, math.inf)])
+				
+				self.tables.append((divs, paths, centers, children))
+				
+				divs = sub_divs
+				paths = sub_paths
+				
+		return self.tables
+		
+	def group(self, levels, locations) :
+		
+		tables = self.table()
+		depths, nodes = self.assign(levels, locations)
+		
+		keys = depths * max(len(table[0]) for table in tables) + nodes
+		order = numpy.argsort(keys, kind = "stable")
+		starts = numpy.flatnonzero(numpy.diff(keys[order], prepend = -1)).tolist()
+		
+		groups = []
+		for start, end in zip(starts, starts[1 :] + [len(order)]) :
+			i = order[start]
+			groups.append((tables[depths[i]][1][nodes[i]], start, end))
+			
+		return order, groups
+		
+	def assign(self, levels, locations, chunk = 2 ** 16) :
+		
+		tables = self.table()
+		
+		depths = numpy.zeros(len(locations), numpy.intp)
+		nodes = numpy.zeros(len(locations), numpy.intp)
+		
+		for start in range(0, len(locations), chunk) :
+			
+			location = locations[start : start + chunk]
+			level = levels[start : start + chunk]
+			node = nodes[start : start + chunk]
+			depth = depths[start : start + chunk]
+			
+			for l in range(len(tables) - 1) :
+				
+				children = tables[l][3][node]
+				active = (level > l) & (depth == l) & (children[:, 0] >= 0)
+				
+				if not active.any() :
+					break
+					
+				children = children[active]
+				centers = tables[l + 1][2][children]
+				star = location[active]
+				
+				distance = (centers[:, :, 0] - star[:, 0, None]) ** 2 + (centers[:, :, 1] - star[:, 1, None]) ** 2 + (centers[:, :, 2] - star[:, 2, None]) ** 2
+				
+				node[active] = children[numpy.arange(len(children)), distance.argmin(axis = 1)]
+				depth[active] = l + 1
+				
+		return depths, nodes
+		
+	def add_stars(self, levels, block) :
+		
+		tables = self.table()
+		depths, nodes = self.assign(levels, block.location)
+		
+		for star, depth, node in zip(block.stars(), depths.tolist(), nodes.tolist()) :
+			tables[depth][0][node].stars.append(star)
+			
+		
+	def sort(self) :
+		
+		def sort_div(div) :
+			div.stars.sort(key = lambda star : round(star.brightness.brightness * (2 ** 8 - 1)), reverse = True)
+			for sub_div in div.divs :
+				sort_div(sub_div)
+				
+		sort_div(self.div)
+		
+	def write(self, f, version = 3, sort = False) :
+		
+		if sort :
+			self.sort()
+		
+		if version < 2 :
+			to_binary(f, self.level, 1, False, False)
+			self.div.write(f)
+		else :
+			Catalog.assemble(f, self.level, self.div.pack(), Catalog.flag_sorted if sort else 0)
+		
+	@staticmethod
+	def read(f) :
+		
+		magic = f.read(len(Catalog.magic))
+		if magic == Catalog.magic :
+			version = from_binary(f, 1, False, False)
+			flags = from_binary(f, 1, False, False)
+		else :
+			f.seek(-len(magic), 1)
+		
+		level = from_binary(f, 1, False, False)
+		div = Div.read(f)
+		
+		return Catalog(level, div)
+		
+	def save(self, filename, version = 3, sort = False) :
+		with open(filename, "wb") as f :
+			self.write(f, version, sort)
+			
+	@staticmethod
+	def compose(filename, geometry, counts, blocks, version = 3, sort = False) :
+		
+		sizes = {}
+		
+		def content(div, path) :
+			size = 5 + counts.get(path, 0) * Block.dtype.itemsize
+			for i_div, sub_div in enumerate(div.divs) :
+				size += content(sub_div, path + (i_div,)) + 19
+			sizes[path] = size
+			return size
+			
+		content(geometry.div, ())
+		
+		def write_div(div, path, f) :
+			
+			f.write(div.header(sizes[path], counts.get(path, 0)))
+			if sort :
+				f.write(Block.sort(b"".join(blocks(path))))
+			else :
+				for block in blocks(path) :
+					f.write(block)
+				
+			to_binary(f, len(div.divs), 1, False, False)
+			for i_div, sub_div in enumerate(div.divs) :
+				write_div(sub_div, path + (i_div,), f)
+		
+		with open(filename, "w+b") as f :
+			
+			if version < 2 :
+				to_binary(f, geometry.level, 1, False, False)
+				write_div(geometry.div, (), f)
+			else :
+				root = Catalog.head(f, geometry.level, Catalog.flag_sorted if sort else 0)
+				write_div(geometry.div, (), f)
+				f.flush()
+				
+				with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as data :
+					with memoryview(data) as tree :
+						Catalog.foot(f, root, tree[root :])
+						
+	@staticmethod
+	def assemble(f, level, tree, flags = 0) :
+		
+		root = Catalog.head(f, level, flags)
+		f.write(tree)
+		Catalog.foot(f, root, tree)
+		
+	@staticmethod
+	def head(f, level, flags = 0) :
+		
+		f.write(Catalog.magic)
+		to_binary(f, Catalog.version, 1, False, False)
+		to_binary(f, flags, 1, False, False)
+		to_binary(f, level, 1, False, False)
+		
+		return len(Catalog.magic) + 3
+		
+	@staticmethod
+	def foot(f, root, tree) :
+		
+		index = Catalog.index(tree, 0)
+		index["offset"] += root
+		f.write(index.tobytes())
+		
+		to_binary(f, root + len(tree), 8, False, False)
+		to_binary(f, len(index), 4, False, False)
+		
+	@staticmethod
+	def index(data, root) :
+		
+		entries = []
+		stack = [(-1, 0, 0, root)]
+		
+		while stack :
+			
+			parent, depth, path, offset = stack.pop()
+			
+			x, y, z = struct.unpack_from(">iii", data, offset)
+			radius = int.from_bytes(data[offset + 12 : offset + 15], byteorder = "big")
+			count = struct.unpack_from(">I", data, offset + 19)[0]
+			
+			brightness = 0
+			if count > 0 :
+				brightness = numpy.frombuffer(data, Block.dtype, count, offset + 23)["brightness"].max().item()
+			
+			entry = len(entries)
+			entries.append((parent, depth, path, offset + 23, count, (x, y, z), radius, brightness))
+			
+			offset += 23 + count * Block.dtype.itemsize
+			divs = data[offset]
+			offset += 1
+			
+			children = []
+			for i_div in range(divs) :
+				children.append((entry, depth + 1, path * 32 + i_div, offset))
+				offset += 19 + struct.unpack_from(">I", data, offset + 15)[0]
+			stack.extend(reversed(children))
+		
+		index = numpy.array(entries, Catalog.index_dtype)
+		
+		for depth in range(index["depth"].max(), 0, -1) :
+			entries = numpy.flatnonzero(index["depth"] == depth)
+			numpy.maximum.at(index["brightness"], index["parent"][entries], index["brightness"][entries])
+		
+		return index
+		
+	@staticmethod
+	def upgrade(source, destination) :
+		
+		with open(source, "rb") as f :
+			data = f.read()
+			
+		if data[: len(Catalog.magic)] == Catalog.magic :
+			flags = data[5]
+			level = data[6]
+			root = len(Catalog.magic) + 3
+			end = struct.unpack_from(">Q", data, len(data) - 12)[0]
+		else :
+			flags = 0
+			level = data[0]
+			root = 1
+			end = len(data)
+			
+		with open(destination, "wb") as f :
+			Catalog.assemble(f, level, memoryview(data)[root : end], flags)
+			
+	@staticmethod
+	def merge(sources, destination, level = None, sort = False, version = 3) :
+		
+		catalogs = []
+		
+		try :
+			
+			for source in sources :
+				filename, levels = (source, None) if isinstance(source, str) else source
+				catalogs.append((CatalogFile(filename), levels))
+				
+			if level is None :
+				level = max(catalog.level for catalog, levels in catalogs)
+				
+			geometry = Catalog.create(level)
+			tables = geometry.table()
+			
+			headers = {}
+			for divs, paths, centers, children in tables :
+				for div, path in zip(divs, paths) :
+					headers[path] = div.header(0, 0)[: 15]
+					
+			parts = {}
+			counts = {}
+			
+			def append(path, part, count) :
+				parts.setdefault(path, []).append(part)
+				counts[path] = counts.get(path, 0) + count
+			
+			for catalog, levels in catalogs :
+				
+				index = catalog.index if catalog.index is not None else Catalog.index(catalog.data, catalog.root)
+				entries = list(zip(index["depth"].tolist(), index["path"].tolist(), index["offset"].tolist(), index["count"].tolist()))
+				index = None
+				
+				for depth, code, offset, count in entries :
+					path = tuple((code >> (5 * (depth - 1 - i))) & 31 for i in range(depth))
+					if headers.get(path) != catalog.data[offset - 23 : offset - 8] :
+						raise ValueError("incompatible geometry at " + str(path))
+						
+				if levels is None :
+					
+					for depth, code, offset, count in entries :
+						if count > 0 :
+							append(tuple((code >> (5 * (depth - 1 - i))) & 31 for i in range(depth)), (catalog, offset, count), count)
+					continue
+					
+				records = numpy.concatenate([numpy.frombuffer(catalog.data, Block.dtype, count, offset) for depth, code, offset, count in entries if count > 0] + [numpy.empty(0, Block.dtype)], dtype = Block.dtype)
+				brightness = records["brightness"] / (2 ** 8 - 1)
+				
+				s_levels = numpy.full(len(records), -1)
+				for l, low, high in levels :
+					s_levels[(s_levels == -1) & (brightness <= Compute.mags(low)) & (brightness > Compute.mags(high))] = l
+				
+				records = records[s_levels >= 0]
+				order, groups = geometry.group(s_levels[s_levels >= 0], records["location"] / (2 ** 31 - 1))
+				records = records[order]
+				
+				for path, start, end in groups :
+					append(path, records[start : end].tobytes(), end - start)
+					
+			def blocks(path) :
+				for part in parts.get(path, []) :
+					if isinstance(part, bytes) :
+						yield part
+					else :
+						catalog, offset, count = part
+						yield catalog.data[offset : offset + count * Block.dtype.itemsize]
+			
+			temporary = destination + ".part"
+			
+			Catalog.compose(temporary, geometry, counts, blocks, version, sort)
+							
+		finally :
+			
+			parts = None
+			for catalog, levels in catalogs :
+				catalog.close()
+				
+		os.replace(temporary, destination)
+			
+class Spool :
+	
+	def __init__(self, level, limit = 2 ** 28, directory = None, cache = None) :
+		
+		self.level = level
+		self.limit = limit
+		self.geometry = Catalog.create(level, cache)
+		self.directory = tempfile.TemporaryDirectory(dir = directory)
+		
+		self.buffers = {}
+		self.counts = {}
+		self.size = 0
+		self.runs = []
+		
+	def add_star(self, level, star) :
+		
+		self.extend(self.geometry.locate(level, star.location), [star])
+		
+	def add_stars(self, levels, block) :
+		
+		order, groups = self.geometry.group(levels, block.location)
+		
+		data = memoryview(numpy.frombuffer(block.pack(), Block.dtype)[order].tobytes())
+		
+		for path, start, end in groups :
+			self.write(path, data[start * Block.dtype.itemsize : end * Block.dtype.itemsize])
+		
+	def extend(self, path, stars) :
+		
+		self.write(path, b"".join(star.pack() for star in stars))
+		
+	def write(self, path, data) :
+		
+		path = tuple(path)
+		
+		if path not in self.buffers :
+			self.buffers[path] = io.BytesIO()
+		
+		self.buffers[path].write(data)
+			
+		self.counts[path] = self.counts.get(path, 0) + len(data) // Block.dtype.itemsize
+		self.size += len(data)
+		
+		if self.size >= self.limit :
+			self.spill()
+			
+	def spill(self) :
+		
+		if not self.buffers :
+			return
+		
+		filename = os.path.join(self.directory.name, str(len(self.runs)))
+		
+		with open(filename, "wb") as f :
+			for path in sorted(self.buffers) :
+				buffer = self.buffers[path].getbuffer()
+				to_binary(f, len(path), 1, False, False)
+				for i in path :
+					to_binary(f, i, 1, False, False)
+				to_binary(f, len(buffer) // Block.dtype.itemsize, 4, False, False)
+				f.write(buffer)
+				
+		self.runs.append(filename)
+		self.buffers = {}
+		self.size = 0
+		
+	def close(self) :
+		
+		self.buffers = {}
+		self.directory.cleanup()
+		
+	def save(self, filename, version = 3, sort = False) :
+		
+		self.spill()
+		
+		runs = [Run(run) for run in self.runs]
+		
+		def blocks(path) :
+			for run in runs :
+				yield from run.chunks(path)
+		
+		try :
+			Catalog.compose(filename, self.geometry, self.counts, blocks, version, sort)
+		finally :
+			
+			for run in runs :
+				run.close()
+			self.close()
+			
+class Run :
+	
+	def __init__(self, filename) :
+		
+		self.file = open(filename, "rb")
+		self.next()
+		
+	def next(self) :
+		
+		length = self.file.read(1)
+		
+		if length :
+			self.path = tuple(self.file.read(length[0]))
+			self.count = from_binary(self.file, 4, False, False)
+		else :
+			self.path = None
+			
+	def chunks(self, path) :
+		
+		if self.path == path :
+			remaining = self.count * Block.dtype.itemsize
+			while remaining > 0 :
+				data = self.file.read(min(remaining, 2 ** 20))
+				yield data
+				remaining -= len(data)
+			self.next()
+			
+	def close(self) :
+		self.file.close()
+			
+class CatalogFile :
+	
+	def __init__(self, filename, budget = 0) :
+		
+		self.file = open(filename, "rb")
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		self.data = memoryview(self.map)
+		
+		if self.data[: len(Catalog.magic)] == Catalog.magic :
+			
+			self.version = self.data[4]
+			self.flags = self.data[5]
+			self.level = self.data[6]
+			self.root = len(Catalog.magic) + 3
+			
+			offset, count = struct.unpack_from(">QI", self.data, len(self.data) - 12)
+			dtype = Catalog.index_dtypes[self.version]
+			self.index = numpy.frombuffer(self.data[offset : offset + count * dtype.itemsize], dtype)
+			self.prepare()
+			
+		else :
+			
+			self.version = 1
+			self.flags = 0
+			self.level = self.data[0]
+			self.root = 1
+			self.index = None
+			self.bounds = None
+		
+		self.resident = {}
+		if budget > 0 :
+			self.load(budget)
+		
+	def prepare(self) :
+		
+		self.centers = self.index["center"] / (2 ** 31 - 1)
+		self.radii = self.index["radius"] / (2 ** 24 - 1) * math.pi
+		self.parents = self.index["parent"].astype(numpy.intp)
+		self.levels = [numpy.flatnonzero(self.index["depth"] == depth) for depth in range(self.index["depth"].max() + 1)]
+		self.bounds = self.index["brightness"] / 255 if "brightness" in self.index.dtype.names else None
+		
+	def __enter__(self) :
+		return self
+		
+	def __exit__(self, *args) :
+		self.close()
+		
+	def close(self) :
+		
+		self.resident = {}
+		self.index = None
+		self.data.release()
+		self.map.close()
+		self.file.close()
+		
+	def header(self, offset) :
+		
+		x, y, z = struct.unpack_from(">iii", self.data, offset)
+		radius = int.from_bytes(self.data[offset + 12 : offset + 15], byteorder = "big")
+		size, count = struct.unpack_from(">II", self.data, offset + 15)
+		
+		center = Vector(x / (2 ** 31 - 1), y / (2 ** 31 - 1), z / (2 ** 31 - 1))
+		
+		return center, Angle(radius / (2 ** 24 - 1) * math.pi), size, count
+		
+	def find(self, path) :
+		
+		if self.index is None :
+			raise ValueError("unindexed catalog, version " + str(self.version) + " : upgrade it to find Divs")
+		
+		code = 0
+		for i in path :
+			code = code * 32 + i
+			
+		entries = numpy.flatnonzero((self.index["depth"] == len(path)) & (self.index["path"] == code))
+		
+		if len(entries) == 0 :
+			return None
+			
+		return entries[0].item()
+		
+	def visible(self, query) :
+		
+		location = query.camera.location
+		center = self.centers
+		
+		distance = numpy.arccos(numpy.clip(location.x * center[:, 0] + location.y * center[:, 1] + location.z * center[:, 2], -1, 1))
+		
+		visible = (self.index["depth"] <= query.max_level) & (distance <= query.frame.angle + self.radii)
+		if self.bounds is not None :
+			visible &= query.weight(self.bounds) > query.min_weight
+		for level in self.levels[1 :] :
+			visible[level] &= visible[self.parents[level]]
+			
+		return numpy.flatnonzero(visible)
+		
+	def block(self, offset, count) :
+		
+		if offset in self.resident :
+			
+			block = self.resident[offset]
+			if count < len(block) :
+				block = Block(block.location[: count], block.brightness[: count], block.color[: count])
+				
+			return block
+		
+		return Block.parse(self.data[offset : offset + count * Block.dtype.itemsize])
+		
+	def load(self, budget) :
+		
+		levels = []
+		
+		def explore_div(l, offset) :
+			
+			center, radius, size, count = self.header(offset)
+			end = offset + 19 + size
+			
+			if l == len(levels) :
+				levels.append([])
+			
+			offset += 23
+			levels[l].append((offset, count))
+			offset += count * Block.dtype.itemsize
+			
+			divs = self.data[offset]
+			offset += 1
+			for i_div in range(divs) :
+				offset = explore_div(l + 1, offset)
+				
+			return end
 			
-				return Div(center, radius, [], divs)
+		explore_div(0, self.root)
+		
+		resident = {}
+		used = 0
+		
+		for level in levels :
 			
-			for face in faces :
-				a = face[0]
-				b = face[1]
-				c = face[2]
+			blocks = {}
+			for offset, count in level :
+				blocks[offset] = Block.parse(self.data[offset : offset + count * Block.dtype.itemsize])
+				used += blocks[offset].nbytes()
 				
-				ab = Vector((a.x + b.x) / 2, (a.y + b.y) / 2, (a.z + b.z) / 2)
-				bc = Vector((b.x + c.x) / 2, (b.y + c.y) / 2, (b.z + c.z) / 2)
-				ca = Vector((c.x + a.x) / 2, (c.y + a.y) / 2, (c.z + a.z) / 2)
+			if used > budget :
+				break
+				
+			resident.update(blocks)
 			
-				divs.append(sface(1, level, a, b, c, ab, bc, ca))
+		self.resident = resident
 		
-		return Catalog(level, Div(Vector(0, 0, 1), Angle(math.pi), [], divs))
+	def divs(self, query) :
+		
+		if self.index is not None :
 			
-	def add_star(self, level, star) :
+			entries = self.visible(query)
+			
+			offsets = self.index["offset"][entries].tolist()
+			counts = self.index["count"][entries].tolist()
+			
+			query.stats.divs_culled += len(self.index) - len(entries)
+			query.stats.bytes_skipped += (self.index["count"].sum().item() - sum(counts)) * Block.dtype.itemsize
+			
+			if self.flags & Catalog.flag_sorted :
+				passing = self.passing(query, offsets, counts)
+				query.stats.bytes_skipped += (sum(counts) - sum(passing)) * Block.dtype.itemsize
+				counts = passing
+			
+			return list(zip(entries.tolist(), offsets, counts))
 		
-		if level == 0 :
-			self.div.stars.append(star)
-		else :
+		divs = []
 		
-			divs = self.div.divs
+		def explore_div(l, offset) :
+			
+			center, radius, size, count = self.header(offset)
+			end = offset + 19 + size
 			
-			for l in range(level) :
+			if query.visible(l, center, radius) :
 				
-				best_distance = 4
+				offset += 23
+				divs.append((None, offset, count))
+				offset += count * Block.dtype.itemsize
 				
-				for div in divs :
+				divs_count = self.data[offset]
+				offset += 1
+				for i_div in range(divs_count) :
+					offset = explore_div(l + 1, offset)
+					
+			else :
+				
+				query.stats.divs_culled += 1
+				query.stats.bytes_skipped += 19 + size
+				
+			return end
 			
-					distance = (div.center.x - star.location.x) ** 2 + (div.center.y - star.location.y) ** 2 + (div.center.z - star.location.z) ** 2
-					if distance < best_distance :
-						best_distance = distance
-						best = div
-						
-				if l + 1 != level :
-					divs = best.divs
-				else:
-					best.stars.append(star)
+		explore_div(0, self.root)
+		
+		return divs
+		
+	def passing(self, query, offsets, counts) :
+		
+		limit = 256 - numpy.count_nonzero(query.weight(numpy.arange(256) / (2 ** 8 - 1)) > query.min_weight)
+		
+		passing = []
+		for offset, count in zip(offsets, counts) :
+			passing.append(count - numpy.searchsorted(self.brightnesses(offset, count)[::-1], limit).item())
 			
+		return passing
 		
-	def write(self, f) :
+	def brightnesses(self, offset, count) :
 		
-		to_binary(f, self.level, 1, False, False)
-		self.div.write(f)
+		return numpy.frombuffer(self.data, Block.dtype, count, offset)["brightness"]
 		
-	@staticmethod
-	def read(f) :
+	def rank(self, query, divs) :
 		
-		level = from_binary(f, 1, False, False)
-		div = Div.read(f)
+		if query.max_stars is None or self.bounds is None or not divs :
+			return [(offset, count, 1) for entry, offset, count in divs]
+			
+		bounds = query.weight(self.bounds[[entry for entry, offset, count in divs]])
+		order = numpy.argsort(-bounds, kind = "stable")
 		
-		return Catalog(level, div)
+		return [(divs[i][1], divs[i][2], bounds[i]) for i in order.tolist()]
+		
+	def query(self, camera, max_level = 10, sensitivity = 50, min_weight = 0.1, max_stars = None, stats = None) :
+		
+		query = Query(camera, max_level, sensitivity, min_weight, max_stars, stats)
+		stats = query.stats
+		
+		start = time.perf_counter()
+		divs = self.rank(query, self.divs(query))
+		start = stats.phase("traverse", start)
+		
+		for i_div, (offset, count, bound) in enumerate(divs) :
+			
+			if bound < query.floor :
+				stats.divs_skipped += len(divs) - i_div
+				stats.bytes_skipped += sum(count for offset, count, bound in divs[i_div :]) * Block.dtype.itemsize
+				break
+				
+			stats.divs_visited += 1
+			
+			if count > 0 :
+				block = self.block(offset, count)
+				stats.bytes_read += count * Block.dtype.itemsize
+				start = stats.phase("decode", start)
+				query.add(block, offset)
+				start = stats.phase("project", start)
+		
+		view = query.view()
+		stats.phase("view", start)
+		stats.finish(view)
+		
+		return view
+		
+class CatalogArray(CatalogFile) :
+	
+	def __init__(self, level, index, location, brightness, color, flags = 0) :
+		
+		self.version = Catalog.version
+		self.flags = flags
+		self.level = level
+		self.index = index
+		self.prepare()
+		
+		self.location = location
+		self.brightness = brightness
+		self.color = color
+		
+		self.resident = {}
+		
+	def close(self) :
+		
+		self.index = None
+		self.location = None
+		self.brightness = None
+		self.color = None
+		
+	def nbytes(self) :
+		return self.index.nbytes + self.location.nbytes + self.brightness.nbytes + self.color.nbytes
+		
+	def block(self, offset, count) :
+		
+		start = offset // Block.dtype.itemsize
+		
+		location = self.location[start : start + count] / (2 ** 31 - 1)
+		brightness = self.brightness[start : start + count] / (2 ** 8 - 1)
+		
+		return Block(location, brightness, self.color[start : start + count])
+		
+	def brightnesses(self, offset, count) :
+		
+		start = offset // Block.dtype.itemsize
+		
+		return self.brightness[start : start + count]
+		
+	def pack(self) :
+		
+		index = self.index
+		
+		content = 5 + index["count"].astype(numpy.int64) * Block.dtype.itemsize
+		for level in reversed(self.levels[1 :]) :
+			numpy.add.at(content, self.parents[level], content[level] + 19)
+			
+		children = numpy.bincount(self.parents[1 :], minlength = len(index))
+		
+		records = numpy.empty(len(self.brightness), Block.dtype)
+		records["location"] = self.location
+		records["brightness"] = self.brightness
+		records["color"] = self.color
+		
+		buffer = bytearray()
+		
+		for center, radius, size, count, offset, divs in zip(index["center"].tolist(), index["radius"].tolist(), content.tolist(), index["count"].tolist(), index["offset"].tolist(), children.tolist()) :
+			
+			start = offset // Block.dtype.itemsize
+			
+			buffer += struct.pack(">iii", *center)
+			buffer += radius.to_bytes(3, byteorder = "big")
+			buffer += struct.pack(">II", size, count)
+			buffer += records[start : start + count].tobytes()
+			buffer.append(divs)
+			
+		return bytes(buffer)
 		
 	def save(self, filename) :
 		with open(filename, "wb") as f :
-			self.write(f)
+			Catalog.assemble(f, self.level, self.pack(), self.flags)
+			
+	@staticmethod
+	def parse(data, root, level, flags = 0) :
+		
+		index = Catalog.index(data, root)
+		
+		records = numpy.concatenate([numpy.frombuffer(data, Block.dtype, count, offset) for offset, count in zip(index["offset"].tolist(), index["count"].tolist())] + [numpy.empty(0, Block.dtype)])
+		
+		index["offset"] = (numpy.cumsum(index["count"], dtype = numpy.int64) - index["count"]) * Block.dtype.itemsize
+		
+		return CatalogArray(level, index, records["location"].astype(numpy.int32), records["brightness"].copy(), records["color"].copy(), flags)
+		
+	@staticmethod
+	def read(filename) :
+		
+		with open(filename, "rb") as f :
+			data = f.read()
+			
+		if data[: len(Catalog.magic)] == Catalog.magic :
+			return CatalogArray.parse(data, len(Catalog.magic) + 3, data[6], data[5])
+			
+		return CatalogArray.parse(data, 1, data[0])
+		
+	@staticmethod
+	def from_catalog(catalog) :
+		
+		return CatalogArray.parse(catalog.div.pack(), 0, catalog.level)
+		
+class Tracker :
+	
+	def __init__(self, catalog, max_level = 10, sensitivity = 50, min_weight = 0.1, max_stars = None) :
+		
+		self.catalog = catalog
+		self.max_level = max_level
+		self.sensitivity = sensitivity
+		self.min_weight = min_weight
+		self.max_stars = max_stars
+		
+		self.blocks = {}
+		self.block = Block.concatenate([])
+		
+	def update(self, camera, stats = None) :
+		
+		query = Query(camera, self.max_level, self.sensitivity, self.min_weight, self.max_stars, stats)
+		stats = query.stats
+		
+		start = time.perf_counter()
+		divs = self.catalog.divs(query)
+		start = stats.phase("traverse", start)
+		
+		blocks = {}
+		for entry, offset, count in divs :
+			stats.divs_visited += 1
+			if count > 0 :
+				if (offset, count) in self.blocks :
+					blocks[(offset, count)] = self.blocks[(offset, count)]
+				else :
+					blocks[(offset, count)] = self.catalog.block(offset, count)
+					stats.bytes_read += count * Block.dtype.itemsize
+		
+		if list(blocks) != list(self.blocks) :
+			self.block = Block.concatenate(list(blocks.values()))
+		self.blocks = blocks
+		start = stats.phase("decode", start)
+		
+		query.add(self.block)
+		start = stats.phase("project", start)
+		
+		view = query.view()
+		stats.phase("view", start)
+		stats.finish(view)
+		
+		return view
 			
 class Camera :
 
@@ -395,117 +1469,333 @@ class Camera :
 			self.anchor.z = self.location.z + v_c.z * cos_c + (v_c.x * self.location.y - v_c.y * self.location.x) * sin_c + self.location.z * f_c * (1 - cos_c)
 			
 		
-class View :
+class Stats :
 	
-	def __init__(self, location, anchor, frame, rotation, stars) :
-		self.location = location
-		self.anchor = anchor
-		self.frame = frame
-		self.rotation = rotation
-		self.stars = stars
+	def __init__(self, hook = None) :
 		
-	@staticmethod	
-	def catalog_file(filename, camera, max_level = 10, sensitivity = 50, min_weight = 0.1) :
+		self.hook = hook
+		
+		self.divs_visited = 0
+		self.divs_culled = 0
+		self.divs_skipped = 0
+		self.bytes_read = 0
+		self.bytes_skipped = 0
+		self.stars_decoded = 0
+		self.stars_frame = 0
+		self.stars_weight = 0
+		self.stars_emitted = 0
+		self.times = {}
+		
+	def phase(self, name, start) :
+		
+		now = time.perf_counter()
+		self.times[name] = self.times.get(name, 0) + now - start
+		
+		return now
+		
+	def finish(self, view) :
+		
+		self.stars_emitted += len(view.stars)
 		
-		origin = Origin(camera.location)
+		if self.hook is not None :
+			self.hook(self)
+			
+	def dict(self) :
+		
+		return {
+			"divs_visited" : self.divs_visited,
+			"divs_culled" : self.divs_culled,
+			"divs_skipped" : self.divs_skipped,
+			"bytes_read" : self.bytes_read,
+			"bytes_skipped" : self.bytes_skipped,
+			"stars_decoded" : self.stars_decoded,
+			"stars_frame" : self.stars_frame,
+			"stars_weight" : self.stars_weight,
+			"stars_emitted" : self.stars_emitted,
+			"times" : dict(self.times)
+		}
+		
+class Query :
+	
+	def __init__(self, camera, max_level = 10, sensitivity = 50, min_weight = 0.1, max_stars = None, stats = None) :
+		
+		self.camera = camera
+		self.max_level = max_level
+		self.min_weight = min_weight
+		self.max_stars = max_stars
+		self.stats = Stats() if stats is None else stats
+		self.floor = 0
+		
+		self.origin = Origin(camera.location)
 		
-		v_anchor = origin.apply(camera.anchor)
+		v_anchor = self.origin.apply(camera.anchor)
 		
-		frame = Angle(math.acos(camera.location.x * camera.anchor.x + camera.location.y * camera.anchor.y + camera.location.z * camera.anchor.z))
+		self.frame = Angle(math.acos(camera.location.x * camera.anchor.x + camera.location.y * camera.anchor.y + camera.location.z * camera.anchor.z))
 		
 		if v_anchor.x > 0 :
-			rotation = Angle(-math.atan(v_anchor.y / v_anchor.x))
+			self.rotation = Angle(-math.atan(v_anchor.y / v_anchor.x))
 		elif v_anchor.x < 0 :
-			rotation = Angle(-math.atan(v_anchor.y / v_anchor.x) + math.pi)
+			self.rotation = Angle(-math.atan(v_anchor.y / v_anchor.x) + math.pi)
 		else :
 			if v_anchor.y <= 0 :
-				rotation = Angle(math.pi / 2)
+				self.rotation = Angle(math.pi / 2)
 			else :
-				rotation = Angle(3 * math.pi / 2)
+				self.rotation = Angle(3 * math.pi / 2)
+		
+		self.target_weight = (((self.frame.angle / math.pi) ** 0.2 * 0.75) - 0.5)
+		self.filter_power = 100 / sensitivity
+		
+		self.stars = []
+		self.keys = []
+		self.buffered = 0
+		
+	def visible(self, l, center, radius) :
+		
+		location = self.camera.location
+		
+		distance = math.acos(min(max(location.x * center.x + location.y * center.y + location.z * center.z, -1), 1))
+		
+		return l <= self.max_level and distance <= self.frame.angle + radius.angle
+		
+	def weight(self, brightness) :
+		
+		b = brightness - self.target_weight
+		
+		low = 0.5 * numpy.clip(b * 2, 0, 1) ** self.filter_power
+		high = 1 - 0.5 * numpy.clip(2 - b * 2, 0, 1) ** self.filter_power
+		
+		return numpy.where(b < 0.5, low, high)
+		
+	def add(self, block, offset = 0) :
+		
+		origin = self.origin
+		frame = self.frame.angle
+		
+		x = block.location[:, 0]
+		y = block.location[:, 1]
+		z = block.location[:, 2]
+		
+		v_x = x * origin.x1 + y * origin.x2 + z * origin.x3
+		v_y = x * origin.y1 + y * origin.y2
+		v_z = x * origin.z1 + y * origin.z2 + z * origin.z3
+		
+		t = numpy.arccos(numpy.clip(v_z / numpy.sqrt(v_x ** 2 + v_y ** 2 + v_z ** 2), -1, 1))
+		
+		inside = t < frame
+		weight = self.weight(block.brightness[inside])
+		kept = weight > self.min_weight
+		
+		self.stats.stars_decoded += len(block)
+		self.stats.stars_frame += len(block) - len(weight)
+		self.stats.stars_weight += len(weight) - int(numpy.count_nonzero(kept))
+		
+		p = numpy.arctan2(v_y[inside][kept], v_x[inside][kept])
+		
+		self.stars.append(Projection(p + self.rotation.angle, t[inside][kept] / frame, weight[kept], block.color[inside][kept]))
+		
+		if self.max_stars is not None :
+			self.keys.append(offset + numpy.flatnonzero(inside)[kept] * Block.dtype.itemsize)
+			self.buffered += len(p)
+			if self.buffered > 2 * self.max_stars :
+				self.select()
 			
-		stars = []
+	def select(self) :
 		
-		target_weight = (((frame.angle / math.pi) ** 0.2 * 0.75) - 0.5)
-		filter_power = 100 / sensitivity
+		stars = Projection.concatenate(self.stars)
+		keys = numpy.concatenate(self.keys) if self.keys else numpy.empty(0, numpy.intp)
 		
-		with open(filename, "rb") as f :
+		if len(stars) > self.max_stars > 0 :
 			
-			level = from_binary(f, 1, False, False)
+			floor = numpy.partition(stars.weight, len(stars) - self.max_stars)[len(stars) - self.max_stars]
 			
-			def explore_div(l, stars, f) :
-				center = Vector.read(f)
-				radius = Angle.read(f)
-				
-				distance = math.acos(camera.location.x * center.x + camera.location.y * center.y + camera.location.z * center.z)
-				
-				if l <= max_level and distance <= frame.angle + radius.angle:
-					
-					f.read(4)
-				
-					for i_star in range(from_binary(f, 4, False, False)) :
-						
-						star = Star.read(f)
-
-						v_location = origin.apply(star.location)
-						
-						t = Angle(math.acos(v_location.z / ((v_location.x ** 2 + v_location.y ** 2 + v_location.z ** 2) ** 0.5)))
-						if v_location.x > 0 :
-							p = Angle(math.atan(v_location.y / v_location.x))
-						elif v_location.x < 0 :
-							p = Angle(math.atan(v_location.y / v_location.x) + math.pi)
-						else :
-							if v_location.y <= 0 :
-								p = Angle(math.pi / 2)
-							else :
-								p = Angle(3 * math.pi / 2)
-							
-							
-						if t.angle < frame.angle :
-							b = star.brightness.brightness - target_weight
-							if b < 0.5 :
-								if b < 0 :
-									weight = 0
-								else :
-									weight = 0.5 * (b * 2) ** filter_power
-							else :
-								if b > 1 :
-									weight = 1
-								else :
-									weight = 1 - (0.5 * (2 - b * 2) ** filter_power)
-									
-							if weight > min_weight :
-								stars.append((p.angle + rotation.angle, t.angle / frame.angle, weight, (star.color.r, star.color.g, star.color.b)))
-					
-					for i_div in range(from_binary(f, 1, False, False)) :
-						explore_div(l + 1, stars, f)
-					
-				else :
+			above = numpy.flatnonzero(stars.weight > floor)
+			ties = numpy.flatnonzero(stars.weight == floor)
+			ties = ties[numpy.argsort(keys[ties], kind = "stable")[: self.max_stars - len(above)]]
+			
+			order = numpy.concatenate([above, ties])
+			stars = stars[order]
+			keys = keys[order]
+			
+			self.floor = floor
+			
+		elif self.max_stars == 0 :
+			
+			stars = stars[: 0]
+			keys = keys[: 0]
+			
+		self.stars = [stars]
+		self.keys = [keys]
+		self.buffered = len(stars)
+		
+		return stars, keys
 					
-					f.read(from_binary(f, 4, False, False))
+	def view(self) :
+		
+		if self.max_stars is None :
+			stars = Projection.concatenate(self.stars).sort()
+		else :
+			stars, keys = self.select()
+			stars = stars[numpy.lexsort((keys, -stars.weight))]
+		
+		return View(self.camera.location, self.camera.anchor, self.frame, self.rotation, stars)
+		
+class Projection :
+	
+	def __init__(self, p, t, weight, color) :
+		self.p = p
+		self.t = t
+		self.weight = weight
+		self.color = color
+		
+	def __len__(self) :
+		return len(self.weight)
+		
+	def __iter__(self) :
+		return zip(self.p.tolist(), self.t.tolist(), self.weight.tolist(), map(tuple, self.color.tolist()))
+		
+	def __getitem__(self, key) :
+		
+		if isinstance(key, (slice, numpy.ndarray)) :
+			return Projection(self.p[key], self.t[key], self.weight[key], self.color[key])
 			
-			stars = []
-			explore_div(0, stars, f)
-
-		return View(camera.location, camera.anchor, frame, rotation, sorted(stars, key = lambda star : star[2], reverse = True))
+		return (self.p[key].item(), self.t[key].item(), self.weight[key].item(), tuple(self.color[key].tolist()))
+		
+	def sort(self) :
+		
+		order = numpy.argsort(-self.weight, kind = "stable")
+		
+		return Projection(self.p[order], self.t[order], self.weight[order], self.color[order])
+		
+	@staticmethod
+	def concatenate(projections) :
+		
+		if not projections :
+			return Projection(numpy.empty(0), numpy.empty(0), numpy.empty(0), numpy.empty((0, 3), numpy.uint8))
+		
+		p = numpy.concatenate([projection.p for projection in projections])
+		t = numpy.concatenate([projection.t for projection in projections])
+		weight = numpy.concatenate([projection.weight for projection in projections])
+		color = numpy.concatenate([projection.color for projection in projections])
+		
+		return Projection(p, t, weight, color)
+		
+class View :
+	
+	def __init__(self, location, anchor, frame, rotation, stars) :
+		self.location = location
+		self.anchor = anchor
+		self.frame = frame
+		self.rotation = rotation
+		self.stars = stars
+		
+	@staticmethod
+	def catalog(catalog, camera, max_level = 10, sensitivity = 50, min_weight = 0.1, max_stars = None, stats = None) :
+		
+		return catalog.query(camera, max_level, sensitivity, min_weight, max_stars, stats)
+		
+	@staticmethod	
+	def catalog_file(filename, camera, max_level = 10, sensitivity = 50, min_weight = 0.1, max_stars = None, stats = None) :
+		
+		with CatalogFile(filename) as catalog :
+			return catalog.query(camera, max_level, sensitivity, min_weight, max_stars, stats)
 			
-	def svg(self, b_filename, s_filename, w, h, r_min, r_max) :
+	def svg(self, b_filename, s_filename, w, h, r_min, r_max, chunk = 4096) :
 		
 		diagonal = (w ** 2 + h ** 2) ** 0.5
 		
+		with open(b_filename, "r") as b :
+			head, tail = b.read().replace("%W%", str(w)).replace("%H%", str(h)).split("%STAR%")
+		
 		with open(s_filename, "w") as svg :
-
-			with open(b_filename, "r") as b :
-				base = b.read()
+			
+			svg.write(head)
+			
+			for start in range(0, len(self.stars), chunk) :
 				
 				stars = []
 				
-				for star in self.stars :
+				for star in self.stars[start : start + chunk] :
 					x = 0.5 * (w + math.cos(star[0]) * star[1] * diagonal)
 					y = 0.5 * (h + math.sin(star[0]) * star[1] * diagonal)
 					r = r_min + (r_max - r_min) * star[2]
 					stars.append("<circle cx=\"" + str(x) + "\" cy=\"" + str(y) + "\" r=\"" + str(r) + "\" fill=\"rgb" + str(star[3]) + "\" fill-opacity=\"" + str(star[2]) + "\"/>")
 					
-			svg.write(base.replace("%W%", str(w)).replace("%H%", str(h)).replace("%STAR%", "\n\t\t".join(stars)))
+				if start > 0 :
+					svg.write("\n\t\t")
+				svg.write("\n\t\t".join(stars))
+				
+			svg.write(tail)
+
+	def png(self, s_filename, w, h, r_min, r_max) :
+		
+		diagonal = (w ** 2 + h ** 2) ** 0.5
+		
+		stars = self.stars
+		if not isinstance(stars, Projection) :
+			stars = Projection(*[numpy.array(column) for column in zip(*stars)]) if stars else Projection.concatenate([])
+		
+		x = 0.5 * (w + numpy.cos(stars.p) * stars.t * diagonal)
+		y = 0.5 * (h + numpy.sin(stars.p) * stars.t * diagonal)
+		r = (r_min + (r_max - r_min) * stars.weight).astype(numpy.float32)
+		light = (stars.color / 255 * stars.weight[:, None]).astype(numpy.float32)
+		
+		size = numpy.ceil(r + 0.5).astype(numpy.intp)
+		
+		indices = []
+		values = []
+		
+		for s in numpy.unique(size).tolist() :
+			
+			group = size == s
+			g_x = x[group]
+			g_y = y[group]
+			g_r = r[group]
+			g_light = light[group]
+			
+			offsets = numpy.arange(-s, s + 1)
+			
+			b_x = numpy.floor(g_x)
+			b_y = numpy.floor(g_y)
+			
+			d_x = (b_x + 0.5 - g_x).astype(numpy.float32)[:, None] + offsets.astype(numpy.float32)
+			d_y = (b_y + 0.5 - g_y).astype(numpy.float32)[:, None] + offsets.astype(numpy.float32)
+			
+			coverage = d_y[:, :, None] ** 2 + d_x[:, None, :] ** 2
+			numpy.sqrt(coverage, out = coverage)
+			numpy.subtract(g_r[:, None, None] + numpy.float32(0.5), coverage, out = coverage)
+			
+			p_x = b_x.astype(numpy.intp)[:, None] + offsets
+			p_y = b_y.astype(numpy.intp)[:, None] + offsets
+			
+			inside = (coverage > 0) & ((p_y >= 0) & (p_y < h))[:, :, None] & ((p_x >= 0) & (p_x < w))[:, None, :]
+			star, i_y, i_x = numpy.nonzero(inside)
+			
+			indices.append(p_y[star, i_y] * w + p_x[star, i_x])
+			values.append(numpy.minimum(coverage[star, i_y, i_x], 1)[:, None] * g_light[star])
+			
+		image = numpy.zeros((h * w, 3), numpy.uint8)
+		
+		if indices :
+			
+			indices = numpy.concatenate(indices)
+			values = numpy.concatenate(values)
+			
+			touched = numpy.zeros(h * w, bool)
+			touched[indices] = True
+			pixels = numpy.flatnonzero(touched)
+			
+			lookup = numpy.empty(h * w, numpy.intp)
+			lookup[pixels] = numpy.arange(len(pixels))
+			indices = lookup[indices]
+			
+			total = numpy.empty((len(pixels), 3))
+			for channel in range(3) :
+				total[:, channel] = numpy.bincount(indices, values[:, channel], len(pixels))
+				
+			image[pixels] = numpy.minimum(total * 255 + 0.5, 255)
+				
+		with open(s_filename, "wb") as f :
+			to_png(f, image.reshape(h, w, 3))
 
 class Origin :
 	
@@ -596,6 +1886,9 @@ class Compute :
 		(255, 201,  43),
 		(255, 199,  39)
 	)
+	
+	bv_raw_table = None
+	bv_raw_steps = 10000
 
 	def bv(bv, raw = False) :
 		
@@ -643,10 +1936,54 @@ class Compute :
 			
 			
 		return Color(r, g, b)
+		
+	def bvs(bv, raw = False) :
+		
+		bv = numpy.clip(numpy.asarray(bv, float), -0.4, 2)
+		
+		if raw :
+			
+			if Compute.bv_raw_table is None :
+				Compute.bv_raw_table = Compute.blackbody(numpy.arange(int(2.4 * Compute.bv_raw_steps) + 1) / Compute.bv_raw_steps - 0.4)
+				
+			return Compute.bv_raw_table[numpy.rint((bv + 0.4) * Compute.bv_raw_steps).astype(numpy.intp)]
+			
+		return numpy.array(Compute.bv_table, numpy.uint8)[numpy.rint((bv + 0.4) * 20).astype(numpy.intp)]
+		
+	def blackbody(bv) :
+		
+		t = 4600 * ((1 / ((0.92 * bv) + 1.7)) + (1 / ((0.92 * bv) + 0.62)))
+		
+		x = numpy.where(t <= 4000,
+			(-0.2661239 * ((10 ** 9) / (t ** 3))) - (-0.2343580 * ((10 ** 6) / (t ** 2))) + (0.8776956 * ((10 ** 3) / t)) + 0.179910,
+			(-3.0258469 * ((10 ** 9) / (t ** 3))) + (2.1070379 * ((10 ** 6) / (t ** 2))) + (0.2226347 * ((10 ** 3) / t)) + 0.240390)
+			
+		y = numpy.where(t <= 2222,
+			(-1.1063814 * (x ** 3)) -(1.34811020 * (x ** 2)) + (2.18555832 * x) - 0.20219683,
+			numpy.where(t <= 4000,
+				(-0.9549476 * (x ** 3)) - (1.37418593 * (x ** 2)) + (2.09137015 * x) - 0.16748867,
+				(3.0817580 * (x ** 3)) - (5.87338670 * (x ** 2)) + (3.75112997 * x) - 0.37001483))
+				
+		zero = y == 0
+		y = numpy.where(zero, 1, y)
+		
+		Y = numpy.where(zero, 0, 1)
+		X = numpy.where(zero, 0, (x * Y) / y)
+		Z = numpy.where(zero, 0, ((1 - x - y) * Y) / y)
+		
+		r = (3.2406 * X) + (-1.5372 * Y) + (-0.4986 * Z)
+		g = (-0.9689 * X) + (1.8758 * Y) + (0.0415 * Z)
+		b = (0.0557 * X) + (-0.2040 * Y) + (1.0570 * Z)
+		
+		return numpy.clip(numpy.trunc(numpy.stack([r, g, b], axis = -1) * 255), 0, 255).astype(numpy.uint8)
 
 	def mag(mag) :
 		
 		return Brightness(min(max(1 / (1.2 ** ((1.44 + mag) * math.log(2.5))), 0), 1))
+		
+	def mags(mag) :
+		
+		return numpy.clip(1 / (1.2 ** ((1.44 + numpy.asarray(mag, float)) * math.log(2.5))), 0, 1)
 
 	def ra_dec(ra, dec, angle = False) :
 		
@@ -692,6 +2029,13 @@ class Compute :
 			anchor.normalize()
 			
 			return location, anchor
+			
+	def ra_decs(ra, dec) :
+		
+		t = ((90 - numpy.asarray(dec, float)) / 180) * math.pi
+		p = (numpy.asarray(ra, float) / 12) * math.pi
+		
+		return numpy.stack([numpy.sin(t) * numpy.cos(p), numpy.sin(t) * numpy.sin(p), numpy.cos(t)], axis = -1)
 		
 	def deg(deg) :
 	
@@ -0,0 +1,131 @@
+import skyview
+import convert
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+
+catalog = None
+
+def init_worker(c_filename, budget) :
+
+	global catalog
+	if catalog is None :
+		catalog = skyview.CatalogFile(c_filename, budget)
+
+def tile(task) :
+
+	filename, ra, dec, angle, size, s_format, max_level, sensitivity, min_weight, r_min, r_max = task
+
+	location, anchor = skyview.Compute.ra_dec(ra, dec, angle)
+	view = catalog.query(skyview.Camera(location, anchor), max_level, sensitivity, min_weight)
+
+	temporary = filename + ".part"
+
+	if s_format == "png" :
+		view.png(temporary, size, size, r_min, r_max)
+	else :
+		view.svg("Resource/base.svg", temporary, size, size, r_min, r_max)
+
+	os.replace(temporary, filename)
+
+	return filename, len(view.stars)
+
+def cells(zooms, cache = None) :
+
+	tables = skyview.Catalog.create(max(zooms), cache).table()
+
+	for zoom in zooms :
+		for div, path in zip(tables[zoom][0], tables[zoom][1]) :
+
+			center = div.center
+
+			ra = (math.degrees(math.atan2(center.y, center.x)) % 360) / 15
+			dec = 90 - math.degrees(math.acos(min(max(center.z, -1), 1)))
+			angle = 2 * math.degrees(div.radius.angle * 2 ** 0.5)
+
+			yield zoom, path, ra, dec, angle
+
+def zoom(argument) :
+
+	value = int(argument)
+
+	if value < 1 :
+		raise argparse.ArgumentTypeError("zoom must be 1 or more : " + argument)
+
+	return value
+
+def pyramid(c_filename, directory, zooms, size = 512, s_format = "png", processes = None, budget = 0, max_level = 10, sensitivity = 50, min_weight = 0.1, r_min = 0.5, r_max = 4) :
+
+	if min(zooms) < 1 :
+		raise ValueError("zoom must be 1 or more : " + str(min(zooms)))
+
+	global catalog
+	catalog = skyview.CatalogFile(c_filename, budget)
+
+	tiles = []
+	tasks = []
+
+	for zoom, path, ra, dec, angle in cells(zooms) :
+
+		name = str(zoom) + "/" + "-".join(str(i) for i in path) + "." + s_format
+		filename = os.path.join(directory, name)
+
+		tiles.append({"zoom" : zoom, "path" : list(path), "ra" : ra, "dec" : dec, "angle" : angle, "file" : name})
+
+		if not os.path.exists(filename) :
+			os.makedirs(os.path.dirname(filename), exist_ok = True)
+			tasks.append((filename, ra, dec, angle, size, s_format, max_level, sensitivity, min_weight, r_min, r_max))
+
+	print(str(len(tiles) - len(tasks)) + " tiles already rendered, " + str(len(tasks)) + " to render")
+
+	p_time = time.time()
+
+	try :
+
+		with multiprocessing.Pool(processes, initializer = init_worker, initargs = (c_filename, budget)) as pool :
+			for done, (filename, count) in enumerate(pool.imap_unordered(tile, tasks), 1) :
+				convert.report(done, len(tasks), done, p_time)
+
+	finally :
+
+		catalog.close()
+		catalog = None
+
+	manifest = {
+		"catalog" : os.path.basename(c_filename),
+		"size" : size,
+		"format" : s_format,
+		"zooms" : list(zooms),
+		"max_level" : max_level,
+		"sensitivity" : sensitivity,
+		"min_weight" : min_weight,
+		"tiles" : tiles
+	}
+
+	temporary = os.path.join(directory, "manifest.json.part")
+	with open(temporary, "w") as f :
+		json.dump(manifest, f, indent = 1)
+	os.replace(temporary, os.path.join(directory, "manifest.json"))
+
+	print()
+
+if __name__ == "__main__" :
+
+	parser = argparse.ArgumentParser(description = "Skyview tile pyramid")
+	parser.add_argument("catalog")
+	parser.add_argument("directory", nargs = "?", default = "Tiles")
+	parser.add_argument("--zooms", type = zoom, nargs = "+", default = [1, 2, 3])
+	parser.add_argument("--size", type = int, default = 512)
+	parser.add_argument("--format", choices = ["png", "svg"], default = "png")
+	parser.add_argument("--processes", type = int, default = os.cpu_count())
+	parser.add_argument("--budget", type = int, default = 64 * 2 ** 20)
+	parser.add_argument("--max-level", type = int, default = 10)
+	parser.add_argument("--sensitivity", type = float, default = 50)
+	parser.add_argument("--min-weight", type = float, default = 0.1)
+
+	args = parser.parse_args()
+
+	pyramid(args.catalog, args.directory, args.zooms, args.size, args.format, args.processes, args.budget, args.max_level, args.sensitivity, args.min_weight)